@@ -0,0 +1,445 @@
+# -------------------------------
+# 📊 BENCHMARK SIN RED - GESTOR OPERACIONES CE
+# -------------------------------
+# Ejecuta la app con un Google Sheets en memoria y un stub local de datos.gov.co (mcec-87by)
+# y mide arranque, lectura, guardado, replicación, generación de alertas y "Ver Operaciones".
+#
+#   python benchmark.py                          # 1k / 10k / 100k operaciones
+#   python benchmark.py --tamanos 1000 --latencia-sheets 0.05 --latencia-trm 0.02
+#   python benchmark.py --salida base.json       # guarda resultados
+#   python benchmark.py --base base.json         # falla (código 1) si algún paso es más lento
+
+import argparse
+import collections
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from gestor.storage import COLUMNAS_HISTORIAL, COLUMNAS_OPERACIONES
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gestor_operaciones.py")
+TAMANOS = [1000, 10000, 100000]
+TOLERANCIA = 0.5
+
+# -------------------------------
+# Google Sheets en memoria
+# -------------------------------
+LLAMADAS = collections.Counter()
+_llamadas_lock = threading.Lock()
+
+class FakeSheets:
+    latencia = 0.0
+
+    @classmethod
+    def llamada(cls, nombre):
+        with _llamadas_lock:
+            LLAMADAS[f"sheets.{nombre}"] += 1
+        if cls.latencia:
+            time.sleep(cls.latencia)
+
+class FakeWorksheet:
+    # Subconjunto del API de gspread.Worksheet que usa la app
+    _ids = 0
+
+    def __init__(self, spreadsheet, title, rows=1000, cols=26):
+        FakeWorksheet._ids += 1
+        self.id = FakeWorksheet._ids
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.row_count = int(rows)
+        self.col_count = int(cols)
+        self.data = []
+        self._lock = threading.RLock()
+
+    def _celda(self, fila, col, valor):
+        while len(self.data) < fila:
+            self.data.append([])
+        registro = self.data[fila - 1]
+        while len(registro) < col:
+            registro.append("")
+        registro[col - 1] = valor
+        self.row_count = max(self.row_count, len(self.data))
+
+    def _recortar(self):
+        while self.data and not any(str(v) != "" for v in self.data[-1]):
+            self.data.pop()
+
+    def get_all_values(self, **kwargs):
+        FakeSheets.llamada("get_all_values")
+        with self._lock:
+            self._recortar()
+            ancho = max((len(r) for r in self.data), default=0)
+            return [[str(v) for v in r] + [""] * (ancho - len(r)) for r in self.data]
+
+    def col_values(self, col, **kwargs):
+        FakeSheets.llamada("col_values")
+        with self._lock:
+            self._recortar()
+            valores = [str(r[col - 1]) if len(r) >= col else "" for r in self.data]
+        while valores and valores[-1] == "":
+            valores.pop()
+        return valores
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        FakeSheets.llamada("append_rows")
+        with self._lock:
+            self._recortar()
+            inicio = len(self.data) + 1
+            self.data.extend(list(v) for v in values)
+            self.row_count = max(self.row_count, len(self.data))
+        return {"updates": {"updatedRange": f"'{self.title}'!A{inicio}:Z{inicio + len(values) - 1}"}}
+
+    def batch_update(self, data, **kwargs):
+        from gspread.utils import a1_to_rowcol
+        FakeSheets.llamada("batch_update")
+        with self._lock:
+            for d in data:
+                fila, col = a1_to_rowcol(d["range"].split("!")[-1].split(":")[0])
+                for i, registro in enumerate(d["values"]):
+                    for j, valor in enumerate(registro):
+                        self._celda(fila + i, col + j, valor)
+
+    def update_cells(self, cells, **kwargs):
+        FakeSheets.llamada("update_cells")
+        with self._lock:
+            for c in cells:
+                self._celda(c.row, c.col, c.value)
+
+    def resize(self, rows=None, cols=None):
+        FakeSheets.llamada("resize")
+        with self._lock:
+            if rows is not None:
+                self.row_count = int(rows)
+                del self.data[int(rows):]
+            if cols is not None:
+                self.col_count = int(cols)
+                for registro in self.data:
+                    del registro[int(cols):]
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.hojas = {}
+
+    def worksheet(self, title):
+        import gspread
+        FakeSheets.llamada("worksheet")
+        if title not in self.hojas:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.hojas[title]
+
+    def worksheets(self):
+        FakeSheets.llamada("worksheets")
+        return list(self.hojas.values())
+
+    def add_worksheet(self, title, rows, cols):
+        FakeSheets.llamada("add_worksheet")
+        ws = FakeWorksheet(self, title, rows, cols)
+        self.hojas[title] = ws
+        return ws
+
+    def values_get(self, rango, params=None):
+        # Lo usa gspread_dataframe.get_as_dataframe
+        FakeSheets.llamada("values_get")
+        ws = self.hojas[rango.strip("'").split("!")[0]]
+        with ws._lock:
+            ws._recortar()
+            return {"values": [list(r) for r in ws.data]}
+
+    def batch_update(self, body):
+        FakeSheets.llamada("spreadsheet_batch_update")
+        for peticion in body["requests"]:
+            rango = peticion["deleteDimension"]["range"]
+            ws = next(w for w in self.hojas.values() if w.id == rango["sheetId"])
+            with ws._lock:
+                del ws.data[rango["startIndex"]:rango["endIndex"]]
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        FakeSheets.llamada("open")
+        return self.spreadsheet
+
+    def open_by_url(self, url):
+        FakeSheets.llamada("open")
+        return self.spreadsheet
+
+class FakeCredentials:
+    valid = True
+
+    def refresh(self, request):
+        pass
+
+def instalar_fake_sheets(spreadsheet):
+    # gspread.authorize y las credenciales se resuelven al llamarlas: basta con reemplazarlas
+    import gspread
+    from google.oauth2 import service_account
+
+    def autorizar(creds, **kwargs):
+        FakeSheets.llamada("authorize")
+        return FakeClient(spreadsheet)
+
+    gspread.authorize = autorizar
+    service_account.Credentials.from_service_account_info = classmethod(
+        lambda cls, info, scopes=None: FakeCredentials()
+    )
+
+# -------------------------------
+# Stub de datos.gov.co (mcec-87by)
+# -------------------------------
+def trm_sintetica(fecha):
+    return round(4000 + 250 * math.sin(fecha.toordinal() / 45), 2)
+
+class TrmStubHandler(BaseHTTPRequestHandler):
+    latencia = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with _llamadas_lock:
+            LLAMADAS["trm.get"] += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        where = params.get("$where", "")
+        fechas = [datetime.strptime(f, "%Y-%m-%d").date() for f in _fechas_en(where)]
+        hoy = date.today()
+        if len(fechas) == 2:
+            dias = [fechas[0] + timedelta(days=i) for i in range((fechas[1] - fechas[0]).days + 1)]
+        else:
+            dias = fechas
+        # Como la API real: no hay TRM publicada más allá de mañana
+        dias = [d for d in dias if d <= hoy + timedelta(days=1)]
+        offset = int(params.get("$offset", 0))
+        limite = int(params.get("$limit", 1000))
+        filas = [{"vigenciadesde": f"{d:%Y-%m-%d}T00:00:00.000", "valor": f"{trm_sintetica(d):,.2f}"}
+                 for d in dias[offset:offset + limite]]
+        cuerpo = json.dumps(filas).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+def _fechas_en(where):
+    fechas = []
+    for parte in where.split("'")[1::2]:
+        fechas.append(parte[:10])
+    return fechas
+
+def iniciar_stub_trm(latencia):
+    TrmStubHandler.latencia = latencia
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), TrmStubHandler)
+    threading.Thread(target=servidor.serve_forever, name="trm-stub", daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_address[1]}/resource/mcec-87by.json"
+
+# -------------------------------
+# Datos sintéticos
+# -------------------------------
+def generar_operaciones(n, hoy, semilla=7):
+    rnd = random.Random(semilla)
+    clientes = [f"CLIENTE {i:03d}" for i in range(200)]
+    filas = []
+    for i in range(n):
+        # ETAs de los últimos dos años y los próximos dos meses
+        llegada = hoy - timedelta(days=rnd.randint(-60, 730))
+        cerrada = llegada < hoy - timedelta(days=10)
+        filas.append([
+            f"AT{i:06d}", rnd.choice(["Marítimo", "Aéreo", "Terrestre"]), rnd.choice(["Importación", "Exportación"]),
+            rnd.choice(clientes), f"{llegada:%Y-%m-%d}",
+            f"{llegada - timedelta(days=7):%Y-%m-%d}" if cerrada else "", "hecho" if cerrada else "",
+            f"{llegada - timedelta(days=2):%Y-%m-%d}" if cerrada else "", "hecho" if cerrada else "",
+        ])
+    return filas
+
+def generar_alertas_historial(operaciones):
+    filas = []
+    for op in operaciones:
+        llegada = datetime.strptime(op[4], "%Y-%m-%d").date()
+        registro = f"{llegada - timedelta(days=30):%Y-%m-%d} 09:00:00"
+        filas.append([registro, op[0], op[3], "Programada: Certificación de Fletes",
+                      f"{llegada - timedelta(days=7):%Y-%m-%d}", "FALSE"])
+        filas.append([registro, op[0], op[3], "Programada: Solicitar Liberación",
+                      f"{llegada - timedelta(days=2):%Y-%m-%d}", "FALSE"])
+    return filas
+
+SECRETS = """[auth]
+usuario = "bench"
+password = "bench"
+
+[gcp]
+sheet_id = "benchmark"
+service_account = '{"type": "service_account"}'
+"""
+
+# -------------------------------
+# Ejecución de un tamaño (en su propio proceso)
+# -------------------------------
+def _medir(nombre, paso, resultados):
+    antes = dict(LLAMADAS)
+    tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    paso()
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    delta = {k: v - antes.get(k, 0) for k, v in LLAMADAS.items() if v != antes.get(k, 0)}
+    resultados.append({
+        "paso": nombre,
+        "segundos": round(segundos, 4),
+        "pico_mb": round(pico / 2 ** 20, 2),
+        "llamadas_sheets": sum(v for k, v in delta.items() if k.startswith("sheets.")),
+        "peticiones_trm": delta.get("trm.get", 0),
+        "detalle": delta,
+    })
+
+def _verificar(at, paso):
+    if at.exception:
+        raise RuntimeError(f"{paso}: {at.exception[0].value}")
+
+def ejecutar_tamano(n, latencia_sheets, latencia_trm, timeout):
+    from streamlit.testing.v1 import AppTest
+    from gestor import datos, scraper
+
+    directorio = tempfile.mkdtemp(prefix=f"bench-{n}-")
+    os.chdir(directorio)
+    os.makedirs(".streamlit")
+    with open(os.path.join(".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write(SECRETS)
+
+    hoy = date.today()
+    operaciones = generar_operaciones(n, hoy)
+    spreadsheet = FakeSpreadsheet()
+    ws = spreadsheet.add_worksheet("operaciones", n + 1, len(COLUMNAS_OPERACIONES))
+    ws.data = [list(COLUMNAS_OPERACIONES)] + operaciones
+    ws = spreadsheet.add_worksheet("alertas", 2 * n + 1, len(COLUMNAS_HISTORIAL))
+    ws.data = [list(COLUMNAS_HISTORIAL)] + generar_alertas_historial(operaciones)
+    LLAMADAS.clear()
+
+    FakeSheets.latencia = latencia_sheets
+    instalar_fake_sheets(spreadsheet)
+    scraper.TRM_URL = iniciar_stub_trm(latencia_trm)
+    # Los guardados no despiertan al replicador: la replicación se mide en su propio paso
+    datos.replicacion_en_segundo_plano = False
+
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.session_state["logged_in"] = True
+    resultados = []
+    tracemalloc.start()
+
+    # Primer arranque: el almacén local vacío se hidrata desde Sheets
+    _medir("arranque_en_frio", lambda: _verificar(at.run(), "arranque_en_frio"), resultados)
+    _medir("rerun_en_caliente", lambda: _verificar(at.run(), "rerun_en_caliente"), resultados)
+    _medir("ver_operaciones",
+           lambda: _verificar(at.sidebar.radio[0].set_value("Ver Operaciones").run(), "ver_operaciones"),
+           resultados)
+
+    # "Todas" dibuja una tarjeta por alerta: mediría el render de Streamlit, no la app
+    _medir("alertas_hoy",
+           lambda: _verificar(at.sidebar.radio[0].set_value("Alertas").run(), "alertas_hoy"),
+           resultados)
+    _medir("alertas_proximo_mes",
+           lambda: _verificar(at.selectbox[0].set_value("Próximo mes").run(), "alertas_proximo_mes"),
+           resultados)
+
+    at.sidebar.radio[0].set_value("Registrar Operación").run()
+    at.text_input[0].set_value("BENCH-NUEVA").run()
+    at.text_input[1].set_value("CLIENTE BENCH").run()
+    def registrar():
+        # Con el turno de replicación tomado, tampoco una pasada periódica del replicador cae en la medida
+        with datos.get_journal().turno_replicacion():
+            _verificar(at.button[0].click().run(), "registrar_operacion")
+    _medir("registrar_operacion", registrar, resultados)
+
+    def replicar():
+        # Lleva a Sheets lo que dejó el registro de la operación, en este hilo
+        datos.get_replicador().replicar()
+        if datos.get_journal().backlog():
+            raise RuntimeError("replicacion: quedaron cambios sin llevar a Sheets")
+    _medir("replicacion_a_sheets", replicar, resultados)
+
+    tracemalloc.stop()
+    os.chdir(os.path.dirname(APP))
+    shutil.rmtree(directorio, ignore_errors=True)
+    return resultados
+
+# -------------------------------
+# Orquestación y reporte
+# -------------------------------
+def _imprimir(resultados):
+    print(f"{'operaciones':>11}  {'paso':<22} {'segundos':>9} {'pico MB':>8} {'sheets':>7} {'trm':>5}")
+    for r in resultados:
+        print(f"{r['tamano']:>11,}  {r['paso']:<22} {r['segundos']:>9.3f} {r['pico_mb']:>8.1f} "
+              f"{r['llamadas_sheets']:>7} {r['peticiones_trm']:>5}")
+
+def _regresiones(resultados, base, tolerancia):
+    previos = {(r['tamano'], r['paso']): r for r in base}
+    lentos = []
+    for r in resultados:
+        previo = previos.get((r['tamano'], r['paso']))
+        if previo and r['segundos'] > previo['segundos'] * (1 + tolerancia):
+            lentos.append((r, previo))
+    return lentos
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sin red del gestor de operaciones")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--latencia-sheets", type=float, default=0.0, help="segundos por llamada a Sheets")
+    parser.add_argument("--latencia-trm", type=float, default=0.0, help="segundos por petición a datos.gov.co")
+    parser.add_argument("--timeout", type=float, default=900)
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--base", help="resultados JSON previos para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--un-tamano", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.un_tamano:
+        # Proceso hijo: los recursos por proceso (almacén, cachés, hilos de fondo) no se comparten entre tamaños
+        resultados = ejecutar_tamano(args.un_tamano, args.latencia_sheets, args.latencia_trm, args.timeout)
+        print(json.dumps(resultados))
+        return
+
+    resultados = []
+    for n in args.tamanos:
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--un-tamano", str(n),
+             "--latencia-sheets", str(args.latencia_sheets), "--latencia-trm", str(args.latencia_trm),
+             "--timeout", str(args.timeout)],
+            capture_output=True, text=True
+        )
+        if proceso.returncode != 0:
+            sys.stderr.write(proceso.stderr)
+            sys.exit(f"Falló el benchmark con {n} operaciones")
+        for r in json.loads(proceso.stdout.strip().splitlines()[-1]):
+            resultados.append(dict(r, tamano=n))
+
+    _imprimir(resultados)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            lentos = _regresiones(resultados, json.load(f), args.tolerancia)
+        for r, previo in lentos:
+            print(f"⚠️ Regresión: {r['paso']} con {r['tamano']:,} operaciones "
+                  f"{r['segundos']:.3f}s (antes {previo['segundos']:.3f}s)")
+        if lentos:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+# Núcleo del gestor de operaciones: almacén, réplica en Sheets, TRM y alertas, sin Streamlit.
+# Los módulos solo importan gspread, google-auth o babel cuando de verdad los usan,
+# para que la CLI (python -m gestor) arranque rápido.
@@ -0,0 +1,5 @@
+import sys
+
+from gestor.cli import main
+
+sys.exit(main())
@@ -0,0 +1,81 @@
+import functools
+from datetime import timedelta
+
+import pandas as pd
+
+from gestor import trazas
+from gestor.datos import read_calendario
+from gestor.storage import CALENDARIO_TIPOS
+from gestor.trm import serie_trm
+
+# -------------------------------
+# Motor de alertas
+# -------------------------------
+TIPOS_ALERTA = ['🚢 Llegada de Carga', '📄 Certificación de Fletes', '📦 Solicitar Liberación', '💰 Fecha Facturación']
+COLUMNAS_ALERTA = ['Tipo', 'Consecutivo', 'Cliente', 'Fecha', 'ETA']
+TIPO_CALENDARIO = dict(zip([tipo for tipo, _ in CALENDARIO_TIPOS], TIPOS_ALERTA))
+
+@functools.lru_cache(maxsize=4096)
+def formatear_fecha(fecha, formato):
+    # babel solo se carga cuando algo se muestra con fechas en español
+    from babel.dates import format_date
+    return format_date(fecha, format=formato, locale='es')
+
+def formatear_fechas(fechas, formato, vacio=""):
+    # Localiza cada fecha distinta una sola vez y la propaga a toda la columna
+    fechas = pd.to_datetime(fechas, errors='coerce')
+    etiquetas = {f: formatear_fecha(f.date(), formato) for f in fechas.dropna().unique()}
+    return fechas.map(etiquetas).fillna(vacio)
+
+def _alertas_vacias():
+    vacio = pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c in ('Fecha', 'ETA') else "object") for c in COLUMNAS_ALERTA})
+    vacio['Tipo'] = pd.Categorical([], categories=TIPOS_ALERTA)
+    return vacio
+
+def _entre(df, inicio, fin):
+    # df ordenado por Fecha: el rango se corta por búsqueda binaria, sin recorrer las filas
+    i = df['Fecha'].searchsorted(pd.Timestamp(inicio), side='left') if inicio else 0
+    j = df['Fecha'].searchsorted(pd.Timestamp(fin), side='right') if fin else len(df)
+    return df.iloc[i:j]
+
+@trazas.trazado()
+def generar_alertas(inicio=None, fin=None, trm_hoy_manual=None, trm_manana_manual=None):
+    # Alertas con fecha entre inicio y fin (None = sin límite) a partir del calendario materializado.
+    # La facturación depende de la TRM, así que se calcula aquí sobre las llegadas del rango ampliado un día.
+    calendario = read_calendario(inicio - timedelta(days=1) if inicio else None,
+                                 fin + timedelta(days=1) if fin else None)
+    if calendario.empty:
+        return _alertas_vacias()
+    fijas = _entre(calendario, inicio, fin).assign(Tipo=lambda d: d['Tipo'].map(TIPO_CALENDARIO))
+
+    # Mejor día para facturar: mayor TRM entre el día antes, el de llegada y el siguiente
+    base = calendario[calendario['Tipo'] == "Llegada"]
+    partes = [fijas]
+    if not base.empty:
+        un_dia = pd.Timedelta(days=1)
+        trm = serie_trm(base['ETA'].min().date() - timedelta(days=1), base['ETA'].max().date() + timedelta(days=1),
+                        trm_hoy_manual, trm_manana_manual)
+        candidatos = pd.DataFrame(
+            {d: trm.reindex(base['ETA'] + d * un_dia).to_numpy() for d in (-1, 0, 1)},
+            index=base.index
+        )
+        candidatos = candidatos.where(candidatos > 0)
+        con_trm = candidatos.notna().any(axis=1)
+        desplazamiento = candidatos[con_trm].idxmax(axis=1).astype(int)
+        facturacion = base[con_trm].assign(Tipo=TIPOS_ALERTA[3], Fecha=base.loc[con_trm, 'ETA'] + desplazamiento * un_dia)
+        partes.append(_entre(facturacion.sort_values('Fecha', kind='stable'), inicio, fin))
+
+    alertas = pd.concat(partes, ignore_index=True)[COLUMNAS_ALERTA]
+    alertas['Tipo'] = pd.Categorical(alertas['Tipo'], categories=TIPOS_ALERTA)
+    return alertas.sort_values(['Fecha', 'Tipo'], kind='stable', ignore_index=True)
+
+def rango_filtro(opcion, hoy):
+    if opcion == "Hoy":
+        return hoy, hoy
+    if opcion == "Esta semana":
+        inicio = hoy - timedelta(days=hoy.weekday())
+        return inicio, inicio + timedelta(days=6)
+    if opcion == "Próximo mes":
+        return hoy, hoy + timedelta(days=30)
+    return None, None
+
@@ -0,0 +1,163 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from gestor import config, trazas
+
+# Tareas sin navegador para cron: sincronizar la TRM, listar alertas, archivar, importar y replicar a Sheets.
+# Cada comando importa lo que necesita, así `python -m gestor --help` no carga pandas ni gspread.
+
+FILTROS = ["Hoy", "Esta semana", "Próximo mes", "Todas"]
+
+def _fecha(texto):
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida (AAAA-MM-DD): {texto}")
+
+def _hoy():
+    return datetime.now(config.TIMEZONE).date()
+
+def _replicador():
+    # Sin hilo: la tarea replica de forma síncrona antes de terminar
+    from gestor.datos import SheetsReplicator, get_journal
+    from gestor.sheets import get_replica_sheets
+    return SheetsReplicator(get_journal(), get_replica_sheets())
+
+def _replicar(replicador):
+    from gestor.datos import get_journal
+    replicadas = replicador.replicar()
+    print(f"Replicadas a Sheets: {replicadas} entrada(s); pendientes: {get_journal().backlog()}")
+
+# -------------------------------
+# Comandos
+# -------------------------------
+def comando_trm(args):
+    from gestor.trm import sincronizar_trm
+    hoy = _hoy()
+    inicio = args.desde or hoy
+    fin = args.hasta or hoy + timedelta(days=1)
+    nuevas = sincronizar_trm(inicio, fin)
+    for fecha, trm in sorted(nuevas.items()):
+        print(f"{fecha:%Y-%m-%d}\t{trm:,.2f}")
+    print(f"TRM nuevas guardadas: {len(nuevas)} ({inicio:%Y-%m-%d} a {fin:%Y-%m-%d})")
+    return 0
+
+def comando_alertas(args):
+    from gestor.alertas import generar_alertas, rango_filtro, formatear_fecha
+    inicio, fin = rango_filtro(args.filtro, _hoy())
+    inicio, fin = args.desde or inicio, args.hasta or fin
+    alertas = generar_alertas(inicio, fin, args.trm_hoy, args.trm_manana)
+    if args.formato == "csv":
+        alertas.to_csv(sys.stdout, index=False, date_format="%Y-%m-%d")
+    else:
+        for a in alertas.itertuples(index=False):
+            print(f"{formatear_fecha(a.Fecha.date(), 'full')}\t{a.Tipo}\t{a.Consecutivo}\t{a.Cliente}\t"
+                  f"ETA {a.ETA:%Y-%m-%d}")
+        print(f"Alertas: {len(alertas)}", file=sys.stderr)
+    return 0
+
+def comando_archivar(args):
+    from gestor.datos import Archivador, get_almacen, get_cache_lecturas, get_journal
+    from gestor.sheets import sheets_configurado
+    if sheets_configurado():
+        replicador = _replicador()
+        archivador = Archivador(get_almacen(), get_cache_lecturas(), get_journal(), replicador)
+    else:
+        replicador = None
+        archivador = Archivador(get_almacen(), get_cache_lecturas())
+    operaciones, alertas = archivador.archivar(args.hoy)
+    print(f"Archivadas: {operaciones} operación(es), {alertas} alerta(s)")
+    if replicador is not None and not args.sin_replicar:
+        _replicar(replicador)
+    return 0
+
+def comando_importar(args):
+    from gestor.importacion import importar_operaciones
+    from gestor.sheets import sheets_configurado
+    resultado = importar_operaciones(args.archivo, args.archivo, args.actualizar)
+    print(f"Filas: {resultado['filas']}; creadas: {len(resultado['insertados'])}, "
+          f"actualizadas: {len(resultado['actualizados'])}, sin cambios: {len(resultado['sin_cambios'])}, "
+          f"omitidas (ya existían): {len(resultado['omitidos'])}, repetidas: {len(resultado['duplicados'])}, "
+          f"con errores: {len(resultado['errores'])}")
+    # Las repetidas no cuentan para el código de salida: se importa la última fila de cada Consecutivo
+    for d in resultado['duplicados']:
+        print(f"Aviso: fila {d['Fila']} reemplazada por la fila {d['FilaUsada']} (Consecutivo {d['Consecutivo']})",
+              file=sys.stderr)
+    if resultado['errores']:
+        import pandas as pd
+        errores = pd.DataFrame(resultado['errores'])
+        if args.errores:
+            errores.to_csv(args.errores, index=False, encoding="utf-8-sig")
+            print(f"Reporte de errores en {args.errores}")
+        else:
+            errores.to_csv(sys.stderr, index=False)
+    if sheets_configurado() and not args.sin_replicar:
+        _replicar(_replicador())
+    return 1 if resultado['errores'] else 0
+
+def comando_replicar(args):
+    from gestor.sheets import sheets_configurado
+    if not sheets_configurado():
+        print("Google Sheets no está configurado en secrets.toml", file=sys.stderr)
+        return 1
+    from gestor.datos import get_almacen
+    # El almacén primero: si hay que hidratar o compactar, queda en el registro antes de replicar
+    get_almacen()
+    _replicar(_replicador())
+    return 0
+
+COMANDOS = {
+    "trm": comando_trm,
+    "alertas": comando_alertas,
+    "archivar": comando_archivar,
+    "importar": comando_importar,
+    "replicar": comando_replicar,
+}
+
+def parser():
+    p = argparse.ArgumentParser(prog="python -m gestor", description="Tareas del gestor de operaciones sin la UI.")
+    p.add_argument("--secrets", default=config.SECRETS_TOML, help="secrets.toml a usar (por defecto %(default)s)")
+    sub = p.add_subparsers(dest="comando", required=True)
+
+    trm = sub.add_parser("trm", help="trae y guarda la TRM oficial de un rango (por defecto hoy y mañana)")
+    trm.add_argument("--desde", type=_fecha)
+    trm.add_argument("--hasta", type=_fecha)
+
+    alertas = sub.add_parser("alertas", help="lista las alertas del calendario de un periodo")
+    alertas.add_argument("--filtro", choices=FILTROS, default="Hoy")
+    alertas.add_argument("--desde", type=_fecha, help="reemplaza el inicio del filtro")
+    alertas.add_argument("--hasta", type=_fecha, help="reemplaza el fin del filtro")
+    alertas.add_argument("--trm-hoy", type=float, help="TRM manual de hoy para la fecha de facturación")
+    alertas.add_argument("--trm-manana", type=float, help="TRM manual de mañana")
+    alertas.add_argument("--formato", choices=["texto", "csv"], default="texto")
+
+    archivar = sub.add_parser("archivar", help="mueve al archivo lo antiguo o cerrado y replica el cambio")
+    archivar.add_argument("--hoy", type=_fecha, help="fecha de referencia para los cortes (por defecto hoy)")
+    archivar.add_argument("--sin-replicar", action="store_true", help="deja el cambio en el registro para la UI")
+
+    importar = sub.add_parser("importar", help="importa operaciones desde un CSV o XLSX (sale con 1 si hubo filas con error)")
+    importar.add_argument("archivo")
+    importar.add_argument("--actualizar", action="store_true", help="actualiza las operaciones que ya existen")
+    importar.add_argument("--errores", help="CSV donde escribir el reporte de errores (por defecto, stderr)")
+    importar.add_argument("--sin-replicar", action="store_true", help="deja el cambio en el registro para la UI")
+
+    sub.add_parser("replicar", help="lleva a Google Sheets los cambios pendientes del registro")
+    return p
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    config.cargar_secrets(args.secrets)
+    from gestor import datos
+    # Sin hilo de replicación: cada comando replica antes de salir o lo deja en el registro
+    datos.replicacion_en_segundo_plano = False
+    conf = config.seccion("trazas")
+    if conf.get("activo", True):
+        trazas.configurar(conf.get("archivo", "trazas.jsonl"), int(conf.get("max_mb", 5)) * 1024 * 1024,
+                          int(conf.get("copias", 3)))
+    try:
+        with trazas.tramo(f"cli:{args.comando}"):
+            return COMANDOS[args.comando](args)
+    except Exception as e:
+        print(f"Error en '{args.comando}': {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,74 @@
+import functools
+import os
+import threading
+import tomllib
+
+import pytz
+
+# -------------------------------
+# Configuración común (UI y CLI)
+# -------------------------------
+TIMEZONE = pytz.timezone("America/Bogota")
+
+# Almacén local (primario) y CSV del formato anterior, que se migran una sola vez
+ALMACEN_DB = "gestor.db"
+ARCHIVO_CSV = "operaciones.csv"
+HISTORIAL_CSV = "alertas.csv"
+TRM_HISTORY = "trm_history.csv"
+TRM_DB = "trm_history.db"
+JOURNAL = "cambios_pendientes.jsonl"
+
+# Hora de publicación de la TRM (COL)
+TRM_PUBLICACION = (14, 0)
+
+SECRETS_TOML = os.path.join(".streamlit", "secrets.toml")
+
+_secrets = None
+
+def usar_secrets(secrets):
+    # La UI pasa st.secrets; cualquier objeto con la interfaz de un dict sirve
+    global _secrets
+    _secrets = secrets
+
+def cargar_secrets(path=SECRETS_TOML):
+    # Fuera de Streamlit (CLI, tareas programadas) se lee el mismo secrets.toml
+    try:
+        with open(path, "rb") as f:
+            usar_secrets(tomllib.load(f))
+    except FileNotFoundError:
+        usar_secrets({})
+    return _secrets
+
+def secrets():
+    if _secrets is None:
+        cargar_secrets()
+    return _secrets
+
+def seccion(nombre):
+    try:
+        return dict(secrets().get(nombre, {}))
+    except Exception:
+        return {}
+
+def cache_ttl():
+    # Segundos que una lectura del almacén se reutiliza entre reruns y sesiones
+    try:
+        return int(seccion("cache").get("ttl", 60))
+    except (TypeError, ValueError):
+        return 60
+
+def recurso(funcion):
+    # Un objeto por proceso (lo que st.cache_resource hace en la UI), creado una sola vez
+    # aunque varios hilos lo pidan a la vez
+    lock = threading.Lock()
+    valor = []
+
+    @functools.wraps(funcion)
+    def envoltura():
+        if not valor:
+            with lock:
+                if not valor:
+                    valor.append(funcion())
+        return valor[0]
+    envoltura.limpiar = valor.clear
+    return envoltura
@@ -0,0 +1,439 @@
+import logging
+import random
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from gestor import config, trazas
+from gestor.config import TIMEZONE, ALMACEN_DB, ARCHIVO_CSV, HISTORIAL_CSV, JOURNAL
+from gestor.journal import MutationJournal
+from gestor.sheets import get_replica_sheets, invalidate_sheets_pool, sheets_configurado
+from gestor.storage import SqliteBackend, COLUMNAS_OPERACIONES, COLUMNAS_HISTORIAL, CLAVE_ALERTA, celdas
+
+# Almacén local, caché de lecturas, registro de cambios y sus hilos: un objeto por proceso,
+# compartido por todas las sesiones de la UI o por una tarea de la CLI
+
+_logger = logging.getLogger(__name__)
+
+# Motivo por el que falló la copia inicial desde Sheets, para mostrarlo en la UI
+error_hidratacion = None
+
+# -------------------------------
+# Almacén local
+# -------------------------------
+@trazas.trazado("hidratacion")
+def _hidratar(almacen, replica):
+    # Copia inicial desde la réplica (sin pasar por el registro, para no devolverla a Sheets).
+    # Devuelve cuántas alertas duplicadas tenía la réplica.
+    df = replica.leer_operaciones()
+    filas = [dict(zip(COLUMNAS_OPERACIONES, fila)) for fila in celdas(df, COLUMNAS_OPERACIONES)]
+    almacen.guardar_operaciones([{'upserts': filas, 'deletes': []}])
+    alertas_replica = replica.leer_alertas().values.tolist()
+    duplicadas = len(alertas_replica) - len(almacen.agregar_alertas(alertas_replica))
+    operaciones, alertas = replica.leer_archivo()
+    almacen.agregar_archivo(
+        [dict(zip(COLUMNAS_OPERACIONES, fila)) for fila in celdas(operaciones, COLUMNAS_OPERACIONES)],
+        alertas.values.tolist()
+    )
+    return duplicadas
+
+@config.recurso
+def get_almacen():
+    global error_hidratacion
+    # Con Sheets configurado, un almacén vacío se llena desde Sheets; los CSV del formato anterior
+    # solo se migran cuando no hay réplica (si no, una copia vieja taparía los datos de Sheets)
+    if sheets_configurado():
+        almacen = SqliteBackend(ALMACEN_DB)
+    else:
+        almacen = SqliteBackend(ALMACEN_DB, csv_operaciones=ARCHIVO_CSV, csv_alertas=HISTORIAL_CSV)
+    duplicadas = almacen.compactadas
+    # Arranque sin datos locales (p. ej. disco efímero): única lectura remota, luego todo es local
+    if almacen.vacio() and sheets_configurado():
+        try:
+            duplicadas += _hidratar(almacen, get_replica_sheets())
+        except Exception as e:
+            invalidate_sheets_pool()
+            error_hidratacion = str(e)
+            _logger.warning("No se pudieron copiar los datos de Google Sheets: %s", e)
+    # El historial tenía duplicados: la pestaña de alertas se compacta igual, vía el registro
+    if duplicadas and sheets_configurado():
+        get_journal().append("compactar", {})
+    return almacen
+
+# -------------------------------
+# Caché de lecturas
+# -------------------------------
+CACHE_MAX_POR_TABLA = 16
+
+def _copia(df):
+    # Con copy-on-write (pandas 3, o activado por la UI) basta una copia superficial; sin él, una
+    # profunda, para que quien modifique lo devuelto no toque lo cacheado. La opción global no se cambia aquí.
+    cow = int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write") is True
+    return df.copy(deep=not cow)
+
+class CacheLecturas:
+    # Lecturas por tabla con versión: cada guardado sube la versión y descarta lo cacheado.
+    # Una tabla puede tener varias lecturas cacheadas (ventanas, proyecciones) bajo distintas claves;
+    # como las ventanas cambian con la fecha y los filtros, las vencidas se descartan en cada lectura
+    # y cada tabla guarda como mucho CACHE_MAX_POR_TABLA, sacando la menos usada.
+    def __init__(self, ttl=None):
+        self.ttl = config.cache_ttl() if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._versiones = {}
+        # (tabla, clave) -> (versión, vence, df), de la menos a la más usada
+        self._entradas = OrderedDict()
+
+    def _purgar(self, ahora):
+        for k in [k for k, e in self._entradas.items() if e[1] <= ahora]:
+            del self._entradas[k]
+
+    def get(self, tabla, cargar, ttl=None, clave=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._purgar(_time.monotonic())
+            version = self._versiones.get(tabla, 0)
+            entrada = self._entradas.get((tabla, clave))
+            vigente = entrada is not None and entrada[0] == version
+            if vigente:
+                self._entradas.move_to_end((tabla, clave))
+        if vigente:
+            return _copia(entrada[2])
+
+        with trazas.tramo(f"leer:{tabla}"):
+            df = cargar()
+        with self._lock:
+            # Si hubo un guardado mientras se leía, no se cachea el dato viejo
+            if self._versiones.get(tabla, 0) == version:
+                self._entradas[(tabla, clave)] = (version, _time.monotonic() + ttl, df)
+                self._entradas.move_to_end((tabla, clave))
+                de_tabla = [k for k in self._entradas if k[0] == tabla]
+                for k in de_tabla[:max(0, len(de_tabla) - CACHE_MAX_POR_TABLA)]:
+                    del self._entradas[k]
+        return _copia(df)
+
+    def invalidar(self, tabla):
+        with self._lock:
+            self._versiones[tabla] = self._versiones.get(tabla, 0) + 1
+            for k in [k for k in self._entradas if k[0] == tabla]:
+                del self._entradas[k]
+
+@config.recurso
+def get_cache_lecturas():
+    return CacheLecturas()
+
+def invalidar_lecturas(tabla):
+    get_cache_lecturas().invalidar(tabla)
+
+# -------------------------------
+# Funciones principales
+# -------------------------------
+def read_operaciones_df(desde=None, hasta=None, columnas=None, incluir_archivo=False):
+    # Ventana de FechaLlegada y proyección se resuelven en el almacén, no sobre toda la tabla;
+    # con incluir_archivo también se consultan las operaciones archivadas
+    clave = (desde, hasta, tuple(columnas) if columnas else None, incluir_archivo)
+    return get_cache_lecturas().get(
+        "operaciones",
+        lambda: get_almacen().leer_operaciones(desde, hasta, columnas, incluir_archivo=incluir_archivo),
+        clave=clave
+    )
+
+def read_calendario(desde=None, hasta=None):
+    # Se cachea junto con las operaciones: cualquier guardado o archivado lo invalida
+    return get_cache_lecturas().get(
+        "operaciones", lambda: get_almacen().leer_calendario(desde, hasta), clave=("calendario", desde, hasta)
+    )
+
+def save_operaciones_df(df):
+    for col in COLUMNAS_OPERACIONES:
+        if col not in df.columns:
+            df[col] = ""
+    
+    # Solo las filas que cambiaron respecto al almacén
+    cambios = _cambios_operaciones(get_almacen().leer_operaciones(), df[COLUMNAS_OPERACIONES])
+    _registrar_cambios_operaciones(cambios)
+
+def _registrar_cambios_operaciones(cambios):
+    # Almacén local primero; Sheets los recibe por el registro
+    if not cambios['upserts'] and not cambios['deletes']:
+        return
+    get_almacen().guardar_operaciones([cambios])
+    if sheets_configurado():
+        cambios['hoja'] = "operaciones"
+        get_journal().append("operaciones", cambios)
+        notificar_replicador()
+    invalidar_lecturas("operaciones")
+
+def eliminar_operaciones(consecutivos):
+    _registrar_cambios_operaciones({'upserts': [], 'deletes': [str(c) for c in consecutivos]})
+
+def upsert_operaciones(df_cambios, insertar=True):
+    # Inserta o actualiza por Consecutivo todas las filas a la vez; solo cambian las columnas que trae df_cambios.
+    # Devuelve los consecutivos insertados, actualizados y sin cambios.
+    resultado = {'insertados': [], 'actualizados': [], 'sin_cambios': []}
+    cambios = df_cambios.copy()
+    cambios['Consecutivo'] = cambios['Consecutivo'].fillna("").astype(str).str.strip()
+    cambios = cambios[cambios['Consecutivo'] != ""].drop_duplicates(subset='Consecutivo', keep='last')
+    if cambios.empty:
+        return resultado
+    columnas = [c for c in COLUMNAS_OPERACIONES[1:] if c in cambios.columns]
+
+    # Solo las filas afectadas, por clave primaria
+    actual = get_almacen().leer_operaciones(consecutivos=cambios['Consecutivo'].tolist())
+    celdas_actual = pd.DataFrame(celdas(actual, COLUMNAS_OPERACIONES), columns=COLUMNAS_OPERACIONES,
+                                 index=actual['Consecutivo'].astype(str))
+    celdas_nuevas = pd.DataFrame(celdas(cambios, columnas), columns=columnas, index=cambios['Consecutivo'])
+    existentes = celdas_nuevas.index.isin(celdas_actual.index)
+
+    antes = celdas_actual.loc[celdas_nuevas.index[existentes]]
+    despues = antes.copy()
+    despues.update(celdas_nuevas[existentes])
+    modificadas = (antes != despues).any(axis=1)
+    despues = despues[modificadas]
+    insertadas = celdas_nuevas[~existentes] if insertar else celdas_nuevas.iloc[:0]
+    insertadas = insertadas.reindex(columns=COLUMNAS_OPERACIONES, fill_value="").assign(Consecutivo=insertadas.index)
+
+    _registrar_cambios_operaciones({
+        'upserts': pd.concat([despues, insertadas]).to_dict('records'),
+        'deletes': [],
+    })
+    resultado['insertados'] = insertadas.index.tolist()
+    resultado['actualizados'] = despues.index.tolist()
+    resultado['sin_cambios'] = modificadas.index[~modificadas].tolist()
+    return resultado
+
+def _cambios_operaciones(previo, df_to_save):
+    # Filas nuevas o modificadas (como celdas) y consecutivos eliminados respecto a lo almacenado
+    columnas = COLUMNAS_OPERACIONES
+    anteriores = dict(zip(previo['Consecutivo'].astype(str), celdas(previo, columnas)))
+    nuevas = dict(zip(df_to_save['Consecutivo'].astype(str), celdas(df_to_save, columnas)))
+    return {
+        'upserts': [dict(zip(columnas, celdas)) for cons, celdas in nuevas.items() if anteriores.get(cons) != celdas],
+        'deletes': [cons for cons in anteriores if cons not in nuevas],
+    }
+
+# -------------------------------
+# Manejo de Alertas
+# -------------------------------
+def _clave_alerta(fila):
+    # Identifica una alerta sin depender de su posición en la hoja o en el almacén
+    return tuple("" if pd.isna(fila[k]) else str(fila[k]) for k in CLAVE_ALERTA)
+
+def fila_alerta(consecutivo, cliente, tipo, fecha_suceso):
+    return {
+        "FechaRegistro": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Consecutivo": consecutivo,
+        "Cliente": cliente,
+        "Tipo": tipo,
+        "FechaSuceso": fecha_suceso.strftime("%Y-%m-%d") if isinstance(fecha_suceso, (date, datetime)) else str(fecha_suceso),
+        "Resuelta": False
+    }
+
+def alertas_programadas(consecutivo, cliente, fecha_llegada):
+    # Registro de la operación y tareas a 7 y 2 días del ETA
+    return [
+        fila_alerta(consecutivo, cliente, f"Registro de operación para llegada {fecha_llegada.strftime('%Y-%m-%d')}", datetime.now()),
+        fila_alerta(consecutivo, cliente, "Programada: Certificación de Fletes", fecha_llegada - timedelta(days=7)),
+        fila_alerta(consecutivo, cliente, "Programada: Solicitar Liberación", fecha_llegada - timedelta(days=2)),
+    ]
+
+def guardar_alertas_lote(filas):
+    # Todas las alertas (de una o varias operaciones) en un solo upsert y un solo append a Sheets.
+    # Solo se replican las claves nuevas: volver a guardar una operación no duplica su historial.
+    if not filas:
+        return
+    valores = get_almacen().agregar_alertas([[fila[k] for k in COLUMNAS_HISTORIAL] for fila in filas])
+    if not valores:
+        return
+    if sheets_configurado():
+        get_journal().append("alertas", {'filas': valores})
+        notificar_replicador()
+    invalidar_lecturas("alertas")
+
+def guardar_alerta_historial(consecutivo, cliente, tipo, fecha_suceso):
+    guardar_alertas_lote([fila_alerta(consecutivo, cliente, tipo, fecha_suceso)])
+
+def guardar_alerta(consecutivo, cliente, mensaje):
+    guardar_alerta_historial(consecutivo, cliente, mensaje, datetime.now())
+
+def read_alertas_historial(incluir_archivo=False, desde=None, hasta=None):
+    # Ventana opcional de FechaSuceso, filtrada en el almacén
+    return get_cache_lecturas().get(
+        "alertas", lambda: get_almacen().leer_alertas(incluir_archivo=incluir_archivo, desde=desde, hasta=hasta),
+        clave=(incluir_archivo, desde, hasta)
+    )
+
+def claves_alertas(df):
+    # Clave (Consecutivo, Tipo, FechaSuceso) de cada fila de un historial leído con read_alertas_historial
+    return [_clave_alerta(fila) for fila in df[CLAVE_ALERTA].to_dict('records')]
+
+def marcar_alertas_resueltas(claves):
+    # Las alertas se identifican por su clave, no por su posición en una lectura que pudo cambiar
+    # entre reruns; el replicador escribe solo sus celdas Resuelta
+    claves = list(dict.fromkeys(tuple(str(v) for v in clave) for clave in claves))
+    if not claves:
+        return
+    get_almacen().resolver_alertas(claves)
+    if sheets_configurado():
+        get_journal().append("resolver", {'claves': claves})
+        notificar_replicador()
+    invalidar_lecturas("alertas")
+
+def marcar_alerta_resuelta(clave):
+    marcar_alertas_resueltas([clave])
+
+# -------------------------------
+# Registro de cambios y replicación a Sheets
+# -------------------------------
+REPLICA_INTERVALO = 30
+REPLICA_BACKOFF_MAX = 300
+
+@config.recurso
+def get_journal():
+    return MutationJournal(JOURNAL)
+
+# Cada tipo de entrada del registro se lleva a la réplica en un solo lote
+REPLICADORES = {
+    "operaciones": lambda replica, payloads: replica.guardar_operaciones(payloads),
+    "alertas": lambda replica, payloads: replica.agregar_alertas([f for p in payloads for f in p['filas']]),
+    "resolver": lambda replica, payloads: replica.resolver_alertas([c for p in payloads for c in p['claves']]),
+    "archivar": lambda replica, payloads: replica.archivar([o for p in payloads for o in p['operaciones']],
+                                                           [a for p in payloads for a in p['alertas']]),
+    "compactar": lambda replica, payloads: replica.compactar_alertas(),
+}
+
+class SheetsReplicator(threading.Thread):
+    # Lleva a Sheets los cambios del registro local, en orden y por tramos del mismo tipo
+    def __init__(self, journal, replica):
+        super().__init__(name="sheets-replicator", daemon=True)
+        self.journal = journal
+        self.replica = replica
+        self._evento = threading.Event()
+        self._fallos = 0
+        self.ultimo_error = None
+
+    def notificar(self):
+        self._evento.set()
+
+    def _tramos(self, entradas):
+        # Entradas consecutivas del mismo tipo: se aplican juntas sin alterar el orden global
+        tramos = []
+        for e in entradas:
+            if tramos and tramos[-1][0] == e['tipo']:
+                tramos[-1][1].append(e)
+            else:
+                tramos.append((e['tipo'], [e]))
+        return tramos
+
+    def replicar(self):
+        # Devuelve cuántas entradas llevó a Sheets (0 si otro proceso está replicando)
+        with self.journal.turno_replicacion() as propio:
+            entradas = self.journal.pendientes() if propio else []
+            if not entradas:
+                return 0
+            with trazas.tramo("replicacion"):
+                for tipo, tramo in self._tramos(entradas):
+                    with trazas.tramo(f"replicar:{tipo}"):
+                        REPLICADORES[tipo](self.replica, [e['payload'] for e in tramo])
+                    self.journal.confirmar(tramo)
+            return len(entradas)
+
+    def run(self):
+        while True:
+            if self._fallos:
+                espera = min(REPLICA_BACKOFF_MAX, 2 ** self._fallos) * random.uniform(0.8, 1.2)
+            else:
+                espera = REPLICA_INTERVALO
+            self._evento.wait(espera)
+            self._evento.clear()
+            try:
+                self.replicar()
+                self._fallos = 0
+                self.ultimo_error = None
+            except Exception as e:
+                self.replica.pool.invalidate()
+                self._fallos += 1
+                self.ultimo_error = str(e)
+
+@config.recurso
+def get_replicador():
+    replicador = SheetsReplicator(get_journal(), get_replica_sheets())
+    replicador.start()
+    return replicador
+
+# La CLI lo apaga: replica de forma síncrona antes de salir en lugar de dejar un hilo a medias
+replicacion_en_segundo_plano = True
+
+def notificar_replicador():
+    if replicacion_en_segundo_plano:
+        get_replicador().notificar()
+
+# -------------------------------
+# Archivo de operaciones y alertas antiguas
+# -------------------------------
+ARCHIVO_DIAS_OPERACIONES = 180
+ARCHIVO_DIAS_CERRADAS = 30
+ARCHIVO_DIAS_ALERTAS = 30
+ARCHIVO_DELAY = 120
+ARCHIVO_INTERVALO = 24 * 3600
+
+ESTADOS_REALIZADOS = ["lista", "completado", "hecho", "realizado"]
+
+class Archivador(threading.Thread):
+    # Mueve al archivo lo antiguo o cerrado para que las tablas (y pestañas) activas no crezcan
+    def __init__(self, almacen, cache, journal=None, replicador=None):
+        super().__init__(name="archivador", daemon=True)
+        self.almacen = almacen
+        self.cache = cache
+        self.journal = journal
+        self.replicador = replicador
+        self._stop_event = threading.Event()
+
+    @trazas.trazado("archivado")
+    def archivar(self, hoy=None):
+        hoy = hoy or datetime.now(TIMEZONE).date()
+        operaciones, alertas = self.almacen.archivables(
+            corte=hoy - timedelta(days=ARCHIVO_DIAS_OPERACIONES),
+            corte_cerradas=hoy - timedelta(days=ARCHIVO_DIAS_CERRADAS),
+            estados_cerrados=ESTADOS_REALIZADOS,
+            corte_alertas=hoy - timedelta(days=ARCHIVO_DIAS_ALERTAS),
+        )
+        if not operaciones and not alertas:
+            return 0, 0
+        # Registro antes del movimiento local: si el proceso cae entre ambos, la siguiente pasada vuelve a
+        # archivar lo mismo en local y Sheets no se queda con filas que el almacén ya sacó de las tablas activas
+        if self.journal is not None:
+            self.journal.append("archivar", {'operaciones': operaciones, 'alertas': alertas})
+        self.almacen.archivar(operaciones, alertas)
+        if self.replicador is not None:
+            self.replicador.notificar()
+        self.cache.invalidar("operaciones")
+        self.cache.invalidar("alertas")
+        return len(operaciones), len(alertas)
+
+    def run(self):
+        if self._stop_event.wait(ARCHIVO_DELAY):
+            return
+        while True:
+            try:
+                self.archivar()
+            except Exception:
+                # Se reintenta en la siguiente pasada; nada se borra sin copiarse antes
+                pass
+            if self._stop_event.wait(ARCHIVO_INTERVALO):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+
+@config.recurso
+def iniciar_archivador():
+    if sheets_configurado():
+        archivador = Archivador(get_almacen(), get_cache_lecturas(), get_journal(), get_replicador())
+    else:
+        archivador = Archivador(get_almacen(), get_cache_lecturas())
+    archivador.start()
+    return archivador
+
@@ -0,0 +1,187 @@
+import csv
+import os
+import unicodedata
+from datetime import date, datetime
+
+import pandas as pd
+
+from gestor import trazas
+from gestor.datos import alertas_programadas, get_almacen, guardar_alertas_lote, upsert_operaciones
+from gestor.storage import COLUMNAS_OPERACIONES, COLUMNAS_FECHA, MODALIDADES, TIPOS_OPERACION
+
+# Importación masiva de operaciones desde CSV o Excel: el archivo se lee y valida por lotes
+# y todo lo válido se guarda de una vez (un upsert de operaciones y uno de alertas programadas)
+
+LOTE_IMPORTACION = 500
+COLUMNAS_REQUERIDAS = ['Consecutivo', 'Modalidad', 'Tipo', 'Cliente', 'FechaLlegada']
+FORMATOS_FECHA = ["%Y-%m-%d", "%d/%m/%Y"]
+
+def _normalizar(texto):
+    # Sin tildes ni mayúsculas: "maritimo", "MARÍTIMO" y "Marítimo" son el mismo valor
+    return unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode().strip().lower()
+
+VALORES_VALIDOS = {
+    'Modalidad': {_normalizar(v): v for v in MODALIDADES},
+    'Tipo': {_normalizar(v): v for v in TIPOS_OPERACION},
+}
+
+# -------------------------------
+# Lectura por lotes
+# -------------------------------
+def _texto(valor):
+    # Celdas de Excel como texto: fechas ISO y números enteros sin ".0"
+    if valor is None:
+        return ""
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime("%Y-%m-%d")
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+def _lotes_csv(archivo, tamano):
+    # Separador detectado (coma o punto y coma, según la configuración regional de Excel)
+    try:
+        lector = pd.read_csv(archivo, dtype=str, keep_default_na=False, sep=None, engine="python",
+                             encoding="utf-8-sig", chunksize=tamano)
+        inicio = 2
+        for lote in lector:
+            # Índice = número de fila en el archivo (el encabezado es la fila 1)
+            lote.index = range(inicio, inicio + len(lote))
+            inicio += len(lote)
+            yield lote
+    except pd.errors.EmptyDataError:
+        raise ValueError("El archivo está vacío")
+    except (pd.errors.ParserError, csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"No se pudo leer el CSV: {e}")
+
+def _lotes_xlsx(archivo, tamano):
+    # Modo de solo lectura: openpyxl recorre la hoja sin cargarla entera
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Para importar archivos .xlsx hace falta instalar openpyxl")
+    try:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"No se pudo leer el Excel: {e}")
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [_texto(v).strip() for v in next(filas, ())]
+        if not any(encabezado):
+            raise ValueError("El archivo está vacío")
+        lote, numeros = [], []
+        for numero, fila in enumerate(filas, start=2):
+            valores = [_texto(v) for v in fila][:len(encabezado)]
+            if not any(v.strip() for v in valores):
+                continue
+            lote.append(valores + [""] * (len(encabezado) - len(valores)))
+            numeros.append(numero)
+            if len(lote) == tamano:
+                yield pd.DataFrame(lote, columns=encabezado, index=numeros)
+                lote, numeros = [], []
+        if lote:
+            yield pd.DataFrame(lote, columns=encabezado, index=numeros)
+    finally:
+        libro.close()
+
+def leer_por_lotes(archivo, nombre, tamano=LOTE_IMPORTACION):
+    # DataFrames de texto indexados por número de fila; 'archivo' es una ruta o un objeto tipo archivo
+    extension = os.path.splitext(nombre)[1].lower()
+    if extension == ".csv":
+        return _lotes_csv(archivo, tamano)
+    if extension == ".xlsx":
+        return _lotes_xlsx(archivo, tamano)
+    raise ValueError(f"Formato no soportado: '{extension or nombre}' (use .csv o .xlsx)")
+
+# -------------------------------
+# Validación
+# -------------------------------
+def _fechas(serie):
+    # Primer formato que encaje por fila; "2025-07-29 00:00:00" se toma como fecha
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    for formato in FORMATOS_FECHA:
+        fechas = fechas.fillna(pd.to_datetime(serie.str.slice(0, 10), format=formato, errors='coerce'))
+    return fechas
+
+def validar_lote(lote):
+    # Devuelve las filas válidas (como celdas, con valores normalizados) y los errores por fila
+    lote = lote.rename(columns=lambda c: str(c).strip())
+    faltantes = [c for c in COLUMNAS_REQUERIDAS if c not in lote.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el archivo: {', '.join(faltantes)}")
+    columnas = [c for c in COLUMNAS_OPERACIONES if c in lote.columns]
+    filas = lote[columnas].astype(str).apply(lambda s: s.str.strip())
+
+    mensajes = {}
+    def anotar(mascara, col, mensaje):
+        for fila in filas.index[mascara]:
+            mensajes.setdefault(fila, []).append(mensaje(filas.at[fila, col]))
+
+    anotar(filas['Consecutivo'] == "", 'Consecutivo', lambda v: "Consecutivo vacío")
+    anotar(filas['Cliente'] == "", 'Cliente', lambda v: "Cliente vacío")
+    for col, validos in VALORES_VALIDOS.items():
+        normalizados = filas[col].map(lambda v: validos.get(_normalizar(v)))
+        anotar(normalizados.isna(), col, lambda v: f"Valor de {col} no reconocido: '{v}' (use {', '.join(validos.values())})")
+        filas[col] = normalizados.fillna("")
+    for col in [c for c in COLUMNAS_FECHA if c in columnas]:
+        fechas = _fechas(filas[col])
+        vacias = filas[col] == ""
+        if col == 'FechaLlegada':
+            anotar(vacias, col, lambda v: "FechaLlegada vacía")
+        anotar(~vacias & fechas.isna(), col, lambda v: f"{col} no es una fecha válida: '{v}' (use AAAA-MM-DD o DD/MM/AAAA)")
+        filas[col] = fechas.dt.strftime("%Y-%m-%d").fillna("")
+
+    errores = [{'Fila': fila, 'Consecutivo': filas.at[fila, 'Consecutivo'], 'Error': "; ".join(m)}
+               for fila, m in mensajes.items()]
+    return filas.drop(index=list(mensajes)), errores
+
+# -------------------------------
+# Importación
+# -------------------------------
+@trazas.trazado()
+def importar_operaciones(archivo, nombre, actualizar=False, tamano_lote=LOTE_IMPORTACION):
+    # Valida todo el archivo antes de escribir; lo válido se guarda en un solo lote aunque haya filas con error.
+    # Un Consecutivo repetido en el archivo se toma de su última fila; sin 'actualizar', los que ya
+    # existen en el almacén se omiten. Devuelve los consecutivos por resultado, los errores por fila
+    # y las filas reemplazadas por una posterior del mismo Consecutivo (avisos, no errores).
+    validas = {}
+    errores = []
+    duplicados = []
+    columnas = COLUMNAS_REQUERIDAS
+    filas = 0
+    for lote in leer_por_lotes(archivo, nombre, tamano_lote):
+        filas += len(lote)
+        buenas, malas = validar_lote(lote)
+        errores.extend(malas)
+        columnas = list(buenas.columns)
+        for fila, registro in zip(buenas.index, buenas.to_dict('records')):
+            previa = validas.pop(registro['Consecutivo'], None)
+            if previa is not None:
+                duplicados.append({'Fila': previa[0], 'Consecutivo': registro['Consecutivo'], 'FilaUsada': fila})
+            validas[registro['Consecutivo']] = (fila, registro)
+
+    resultado = {'filas': filas, 'insertados': [], 'actualizados': [], 'sin_cambios': [], 'omitidos': [],
+                 'errores': sorted(errores, key=lambda e: e['Fila']),
+                 'duplicados': sorted(duplicados, key=lambda d: d['Fila'])}
+    if validas and not actualizar:
+        existentes = get_almacen().leer_operaciones(consecutivos=list(validas), columnas=['Consecutivo'])
+        resultado['omitidos'] = [c for c in existentes['Consecutivo'].astype(str) if c in validas]
+        for c in resultado['omitidos']:
+            del validas[c]
+    if not validas:
+        return resultado
+
+    df = pd.DataFrame([registro for _, registro in validas.values()], columns=columnas)
+    guardado = upsert_operaciones(df)
+    for clave in ('insertados', 'actualizados', 'sin_cambios'):
+        resultado[clave] = guardado[clave]
+
+    # Alertas programadas de todas las operaciones nuevas o modificadas, en un solo lote
+    por_consecutivo = df.set_index('Consecutivo')
+    guardar_alertas_lote([
+        alerta
+        for c in guardado['insertados'] + guardado['actualizados']
+        for alerta in alertas_programadas(c, por_consecutivo.at[c, 'Cliente'],
+                                          datetime.strptime(por_consecutivo.at[c, 'FechaLlegada'], "%Y-%m-%d").date())
+    ])
+    return resultado
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Sin flock (Windows): el registro solo queda protegido dentro del proceso
+    fcntl = None
+
+class MutationJournal:
+    # Registro local de solo-anexar con los cambios pendientes de replicar a Google Sheets.
+    # La UI y las tareas de la CLI pueden compartirlo: seq y checkpoint se releen del disco bajo flock.
+    def __init__(self, path):
+        self.path = path
+        self._checkpoint_path = path + ".ckpt"
+        self._lock = threading.Lock()
+        self._confirmado = self._leer_checkpoint()
+        entradas = self._leer_entradas()
+        self._seq = max([e['seq'] for e in entradas] + [self._confirmado])
+        self._pendientes = self._contar(entradas)
+
+    @contextmanager
+    def _bloqueo(self, archivo=".lock", esperar=True):
+        # Exclusión entre procesos; sin esperar, indica si se obtuvo el turno
+        if fcntl is None:
+            yield True
+            return
+        with open(self.path + archivo, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if esperar else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def turno_replicacion(self):
+        # Un solo replicador a la vez entre procesos, para no aplicar dos veces la misma entrada
+        return self._bloqueo(".replica", esperar=False)
+
+    def _contar(self, entradas):
+        pendientes = {}
+        for e in entradas:
+            if e['seq'] > self._confirmado:
+                pendientes[e['tipo']] = pendientes.get(e['tipo'], 0) + 1
+        return pendientes
+
+    def _leer_checkpoint(self):
+        try:
+            with open(self._checkpoint_path, encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _leer_entradas(self):
+        if not os.path.exists(self.path):
+            return []
+        entradas = []
+        with open(self.path, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    entradas.append(json.loads(linea))
+                except ValueError:
+                    # Línea incompleta por un corte a mitad de escritura
+                    continue
+        return entradas
+
+    def append(self, tipo, payload):
+        with self._lock, self._bloqueo():
+            # Otro proceso pudo anexar desde la última vez
+            self._confirmado = max(self._confirmado, self._leer_checkpoint())
+            self._seq = max([self._seq, self._confirmado] + [e['seq'] for e in self._leer_entradas()]) + 1
+            entrada = {"seq": self._seq, "ts": datetime.now().isoformat(timespec="seconds"), "tipo": tipo, "payload": payload}
+            with open(self.path, "a", encoding='utf-8') as f:
+                f.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._pendientes[tipo] = self._pendientes.get(tipo, 0) + 1
+            return self._seq
+
+    def pendientes(self):
+        with self._lock, self._bloqueo():
+            self._confirmado = max(self._confirmado, self._leer_checkpoint())
+            confirmado = self._confirmado
+            entradas = self._leer_entradas()
+        return [e for e in entradas if e['seq'] > confirmado]
+
+    def confirmar(self, entradas):
+        # Marca como replicadas las entradas (prefijo en orden de seq)
+        if not entradas:
+            return
+        with self._lock, self._bloqueo():
+            self._confirmado = max(self._confirmado, self._leer_checkpoint(), entradas[-1]['seq'])
+            tmp = self._checkpoint_path + ".tmp"
+            with open(tmp, "w", encoding='utf-8') as f:
+                f.write(str(self._confirmado))
+            os.replace(tmp, self._checkpoint_path)
+            restantes = self._leer_entradas()
+            self._seq = max([self._seq] + [e['seq'] for e in restantes])
+            self._pendientes = self._contar(restantes)
+            if self._confirmado >= self._seq:
+                # Todo replicado: se vacía el registro para que no crezca
+                open(self.path, "w", encoding='utf-8').close()
+
+    def backlog(self, tipo=None):
+        with self._lock:
+            if tipo is None:
+                return sum(self._pendientes.values())
+            return self._pendientes.get(tipo, 0)
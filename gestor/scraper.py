@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from gestor import trazas
+
+TRM_URL = "https://www.datos.gov.co/resource/mcec-87by.json"
+PAGE_SIZE = 1000
+
+# (conexión, lectura) en segundos; con los reintentos acotan la espera por consulta
+TIMEOUT = (3.05, 6)
+MAX_RETRIES = 2
+BACKOFF = 0.5
+
+class TrmApiError(Exception):
+    # La API no respondió (red, timeout, 5xx o circuito abierto); distinto de "sin datos"
+    pass
+
+class CircuitBreaker:
+    # Tras varios fallos seguidos deja de consultar la API durante un tiempo
+    def __init__(self, max_failures=3, reset_after=60):
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        # Inicio del intento en curso mientras está semiabierto (None si no hay ninguno)
+        self._probing_since = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            ahora = time.monotonic()
+            if ahora - self._opened_at < self.reset_after:
+                return False
+            # Semiabierto: un solo intento a la vez hasta que success() o failure() lo resuelva.
+            # Si el intento nunca se resuelve (p. ej. el hilo murió), a los reset_after se permite otro.
+            if self._probing_since is not None and ahora - self._probing_since < self.reset_after:
+                return False
+            self._probing_since = ahora
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing_since = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing_since = None
+            if self._failures >= self.max_failures:
+                self._opened_at = time.monotonic()
+
+_session = None
+_session_lock = threading.Lock()
+_breaker = CircuitBreaker()
+
+# Respuestas previas por consulta para enviar If-None-Match / If-Modified-Since
+_validators = OrderedDict()
+_validators_lock = threading.Lock()
+MAX_VALIDATORS = 256
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+                respect_retry_after_header=False,
+            )
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=2, pool_maxsize=10))
+            session.headers.update({"Accept": "application/json"})
+            trazas.instrumentar_sesion(session)
+            _session = session
+        return _session
+
+def _get_json(params):
+    # GET con sesión compartida, timeout, reintentos, circuit breaker y peticiones condicionales
+    if not _breaker.allow():
+        return None
+
+    key = tuple(sorted(params.items()))
+    with _validators_lock:
+        previo = _validators.get(key)
+    headers = {}
+    if previo:
+        if previo["etag"]:
+            headers["If-None-Match"] = previo["etag"]
+        if previo["last_modified"]:
+            headers["If-Modified-Since"] = previo["last_modified"]
+
+    try:
+        respuesta = get_session().get(TRM_URL, params=params, headers=headers, timeout=TIMEOUT)
+    except requests.RequestException:
+        _breaker.failure()
+        return None
+
+    if respuesta.status_code == 304 and previo:
+        _breaker.success()
+        return previo["datos"]
+    if respuesta.status_code != 200:
+        if respuesta.status_code >= 500 or respuesta.status_code == 429:
+            _breaker.failure()
+        else:
+            # La API respondió (error de la consulta, no del servicio): cierra el intento semiabierto
+            _breaker.success()
+        return None
+
+    _breaker.success()
+    datos = respuesta.json()
+    etag = respuesta.headers.get("ETag")
+    last_modified = respuesta.headers.get("Last-Modified")
+    if etag or last_modified:
+        with _validators_lock:
+            _validators[key] = {"etag": etag, "last_modified": last_modified, "datos": datos}
+            _validators.move_to_end(key)
+            while len(_validators) > MAX_VALIDATORS:
+                _validators.popitem(last=False)
+    return datos
+
+def _parse_valor(valor):
+    valor = valor.replace(",", "")
+    return round(float(valor), 2)
+
+def obtener_trm_oficial(fecha):
+    fecha_str = fecha.strftime("%Y-%m-%d")
+    datos = _get_json({"$where": f"vigenciadesde='{fecha_str}T00:00:00.000'"})
+    if datos is None:
+        raise TrmApiError(f"No se pudo consultar la TRM del {fecha_str}")
+    if datos:
+        return _parse_valor(datos[0]['valor'])
+    else:
+        return None
+
+def obtener_trm_rango(inicio, fin):
+    # Devuelve {fecha: trm} para cada vigenciadesde entre inicio y fin (inclusive)
+    where = (f"vigenciadesde between '{inicio.strftime('%Y-%m-%d')}T00:00:00.000' "
+             f"and '{fin.strftime('%Y-%m-%d')}T00:00:00.000'")
+    resultado = {}
+    offset = 0
+    while True:
+        params = {
+            "$select": "vigenciadesde,valor",
+            "$where": where,
+            "$order": "vigenciadesde",
+            "$limit": PAGE_SIZE,
+            "$offset": offset,
+        }
+        datos = _get_json(params)
+        if datos is None:
+            return None
+        for fila in datos:
+            try:
+                fecha = datetime.strptime(fila['vigenciadesde'][:10], "%Y-%m-%d").date()
+                resultado[fecha] = _parse_valor(fila['valor'])
+            except (KeyError, ValueError):
+                continue
+        if len(datos) < PAGE_SIZE:
+            return resultado
+        offset += PAGE_SIZE
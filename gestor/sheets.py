@@ -0,0 +1,508 @@
+import bisect
+import json
+import logging
+import threading
+
+import pandas as pd
+
+from gestor import config, trazas
+from gestor.storage import (ReplicaBackend, COLUMNAS_OPERACIONES, COLUMNAS_HISTORIAL, CLAVE_ALERTA,
+                            aplicar_esquema, celdas, filtrar_operaciones)
+
+# gspread, google-auth y gspread_dataframe se importan al primer uso: quien no replica
+# a Sheets (p. ej. la CLI sin credenciales) no paga su importación
+
+_logger = logging.getLogger(__name__)
+
+# Llamadas remotas medidas como tramos de la traza del rerun (o de la tarea en segundo plano)
+@trazas.trazado()
+def get_as_dataframe(*args, **kwargs):
+    from gspread_dataframe import get_as_dataframe as _get_as_dataframe
+    return _get_as_dataframe(*args, **kwargs)
+
+@trazas.trazado()
+def set_with_dataframe(*args, **kwargs):
+    from gspread_dataframe import set_with_dataframe as _set_with_dataframe
+    return _set_with_dataframe(*args, **kwargs)
+
+# -------------------------------
+# Helper functions para Google Sheets
+# -------------------------------
+def extract_sheet_id_from_url(url):
+    try:
+        parts = url.split("/d/")
+        if len(parts) > 1:
+            return parts[1].split("/")[0]
+    except Exception:
+        return None
+    return None
+
+def get_sheet_info_from_secrets():
+    creds_info = None
+    spreadsheet_identifier = None
+
+    secrets = config.secrets()
+    try:
+        if "gcp" in secrets and "service_account" in secrets["gcp"]:
+            sa = secrets["gcp"]["service_account"]
+            creds_info = sa if isinstance(sa, dict) else json.loads(sa)
+            spreadsheet_identifier = secrets["gcp"].get("sheet_id") or secrets["gcp"].get("spreadsheet_url")
+    except Exception:
+        pass
+
+    if creds_info is None and "gcp_service_account" in secrets:
+        try:
+            sa = secrets["gcp_service_account"]
+            creds_info = sa if isinstance(sa, dict) else json.loads(sa)
+        except Exception:
+            pass
+
+    if spreadsheet_identifier is None:
+        try:
+            if "sheets" in secrets:
+                spreadsheet_identifier = secrets["sheets"].get("spreadsheet_url") or secrets["sheets"].get("sheet_id")
+        except Exception:
+            pass
+
+    return creds_info, spreadsheet_identifier
+
+def sheets_configurado():
+    creds_info, spreadsheet_identifier = get_sheet_info_from_secrets()
+    return bool(creds_info and spreadsheet_identifier)
+
+class SheetsPool:
+    # Cliente, hoja de cálculo y pestañas autorizadas, compartidas por todo el proceso
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._creds = None
+        self._client = None
+        self._spreadsheet = None
+        self._spreadsheet_id = None
+        self._worksheets = {}
+        self._snapshots = {}
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                creds_info, _ = get_sheet_info_from_secrets()
+                if not creds_info:
+                    return None
+                scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+                import gspread
+                from google.oauth2 import service_account
+                with trazas.tramo("gspread.authorize"):
+                    self._creds = service_account.Credentials.from_service_account_info(creds_info, scopes=scopes)
+                    self._client = gspread.authorize(self._creds)
+                http_client = getattr(self._client, "http_client", None)
+                trazas.instrumentar_sesion(getattr(http_client, "session", None))
+            # Renovar el token antes de que expire en lugar de esperar un 401
+            if not self._creds.valid:
+                from google.auth.transport.requests import Request as GoogleAuthRequest
+                with trazas.tramo("refresh_token"):
+                    self._creds.refresh(GoogleAuthRequest())
+            return self._client
+
+    def spreadsheet(self):
+        with self._lock:
+            gc = self.client()
+            if not gc:
+                return None, None
+            if self._spreadsheet is None:
+                with trazas.tramo("open_spreadsheet_with"):
+                    self._spreadsheet, self._spreadsheet_id = _open_spreadsheet_with(gc)
+            return self._spreadsheet, self._spreadsheet_id
+
+    def worksheet(self, sheet, title, headers):
+        with self._lock:
+            ws = self._worksheets.get(title)
+            if ws is None:
+                from gspread.exceptions import WorksheetNotFound
+                try:
+                    ws = sheet.worksheet(title)
+                except WorksheetNotFound:
+                    ws = sheet.add_worksheet(title=title, rows="1000", cols=str(len(headers)))
+                    ws.append_row(headers)
+                self._worksheets[title] = ws
+            return ws
+
+    def invalidate(self, title=None):
+        # Tras un fallo se descarta el estado para reautorizar en la siguiente llamada
+        with self._lock:
+            if title is not None:
+                self._worksheets.pop(title, None)
+                self._snapshots.pop(title, None)
+                return
+            self._creds = None
+            self._client = None
+            self._spreadsheet = None
+            self._spreadsheet_id = None
+            self._worksheets = {}
+            self._snapshots = {}
+
+    def snapshot(self, title):
+        with self._lock:
+            return self._snapshots.get(title)
+
+    def set_snapshot(self, title, snapshot):
+        # Última versión leída/escrita de la pestaña: {Consecutivo: (fila, celdas)} para
+        # operaciones, el conjunto de claves ya escritas para alertas
+        with self._lock:
+            if snapshot is None:
+                self._snapshots.pop(title, None)
+            else:
+                self._snapshots[title] = snapshot
+
+@config.recurso
+def get_sheets_pool():
+    return SheetsPool()
+
+def invalidate_sheets_pool(title=None):
+    get_sheets_pool().invalidate(title)
+
+@trazas.trazado()
+def get_gs_client():
+    try:
+        return get_sheets_pool().client()
+    except Exception as e:
+        invalidate_sheets_pool()
+        _logger.error("Error al autenticar con Google: %s", e)
+        return None
+
+def _open_spreadsheet_with(gc):
+    _, spreadsheet_identifier = get_sheet_info_from_secrets()
+    if not spreadsheet_identifier:
+        return None, None
+    
+    try:
+        if spreadsheet_identifier.startswith("http"):
+            sh = gc.open_by_url(spreadsheet_identifier)
+            return sh, spreadsheet_identifier
+        else:
+            sh = gc.open_by_key(spreadsheet_identifier)
+            return sh, spreadsheet_identifier
+    except Exception:
+        try:
+            sheet_id = extract_sheet_id_from_url(spreadsheet_identifier)
+            if sheet_id:
+                return gc.open_by_key(sheet_id), sheet_id
+        except Exception:
+            pass
+    return None, None
+
+@trazas.trazado()
+def open_spreadsheet():
+    if not get_gs_client():
+        return None, None
+    try:
+        return get_sheets_pool().spreadsheet()
+    except Exception:
+        invalidate_sheets_pool()
+        return None, None
+
+# -------------------------------
+# Operaciones con Google Sheets
+# -------------------------------
+def ensure_worksheet(sheet, title, headers):
+    return get_sheets_pool().worksheet(sheet, title, headers)
+
+def _snapshot(df, columns, filas):
+    consecutivos = df['Consecutivo'].astype(str).tolist()
+    if len(set(consecutivos)) != len(consecutivos):
+        return None
+    return {
+        'columns': list(columns),
+        'filas': dict(zip(consecutivos, zip(filas, celdas(df, columns)))),
+    }
+
+def _agrupar_filas(filas):
+    # Filas consecutivas en tramos [inicio, fin] para borrarlas en pocas peticiones
+    tramos = []
+    for fila in sorted(filas):
+        if tramos and fila == tramos[-1][1] + 1:
+            tramos[-1][1] = fila
+        else:
+            tramos.append([fila, fila])
+    return tramos
+
+def _borrar_filas(sh, ws, filas):
+    # De abajo hacia arriba para que los índices sigan siendo válidos dentro del lote
+    sh.batch_update({'requests': [
+        {'deleteDimension': {'range': {'sheetId': ws.id, 'dimension': 'ROWS',
+                                       'startIndex': inicio - 1, 'endIndex': fin}}}
+        for inicio, fin in reversed(_agrupar_filas(filas))
+    ]})
+
+def _guardar_incremental(sh, ws, df, columns, snapshot):
+    # Envía solo los cambios respecto a la última lectura; None si hay que reescribir todo
+    if snapshot is None or snapshot['columns'] != list(columns):
+        return None
+    consecutivos = df['Consecutivo'].astype(str).tolist()
+    if len(set(consecutivos)) != len(consecutivos):
+        return None
+    anteriores = snapshot['filas']
+
+    # La hoja debe seguir como la dejamos (nadie la editó por fuera)
+    col_a = ws.col_values(1)
+    for cons, (fila, _) in anteriores.items():
+        if fila > len(col_a) or str(col_a[fila - 1]) != cons:
+            return None
+
+    from gspread.utils import a1_to_rowcol, rowcol_to_a1
+    nuevas = dict(zip(consecutivos, celdas(df, columns)))
+    ultima_col = len(columns)
+    actualizaciones = [
+        {'range': f"{rowcol_to_a1(fila, 1)}:{rowcol_to_a1(fila, ultima_col)}",
+         'values': [nuevas[cons]]}
+        for cons, (fila, previas) in anteriores.items()
+        if cons in nuevas and nuevas[cons] != previas
+    ]
+    borradas = sorted(fila for cons, (fila, _) in anteriores.items() if cons not in nuevas)
+    agregadas = [cons for cons in consecutivos if cons not in anteriores]
+
+    if actualizaciones:
+        ws.batch_update(actualizaciones, value_input_option="USER_ENTERED")
+    if borradas:
+        _borrar_filas(sh, ws, borradas)
+
+    filas = {}
+    for cons, (fila, _) in anteriores.items():
+        if cons in nuevas:
+            filas[cons] = fila - bisect.bisect_left(borradas, fila)
+    if agregadas:
+        resp = ws.append_rows([nuevas[c] for c in agregadas], value_input_option="USER_ENTERED", table_range="A1")
+        rango = resp.get('updates', {}).get('updatedRange', '')
+        try:
+            inicio = a1_to_rowcol(rango.split('!')[-1].split(':')[0])[0]
+        except Exception:
+            # Guardado, pero sin saber en qué filas quedó: la próxima lectura rehace el snapshot
+            return {}
+        for i, cons in enumerate(agregadas):
+            filas[cons] = inicio + i
+
+    return {'columns': list(columns), 'filas': {c: (filas[c], nuevas[c]) for c in consecutivos}}
+
+def _leer_hoja_operaciones(sh, sheet_title, pool):
+    base_columns = COLUMNAS_OPERACIONES[:5]
+    all_columns = COLUMNAS_OPERACIONES
+    
+    ws = pool.worksheet(sh, sheet_title, all_columns)
+    df = get_as_dataframe(ws, evaluate_formulas=True, usecols=None)
+    if df is None:
+        df = pd.DataFrame(columns=all_columns)
+    
+    # Limpieza de datos
+    df = df.dropna(how="all")
+    reparada = list(df.columns)[:len(all_columns)] != all_columns
+    if list(df.columns)[:len(base_columns)] != base_columns:
+        df.columns = [str(c) for c in df.columns]
+        if len(df.columns) >= len(all_columns):
+            df = df.iloc[:, :len(all_columns)]
+            df.columns = all_columns
+        else:
+            for col in all_columns:
+                if col not in df.columns:
+                    df[col] = ""
+            df = df[all_columns]
+    
+    # Tipos del esquema común (una conversión por columna)
+    df = aplicar_esquema(df.dropna(subset=['Consecutivo'], how='all'))
+    # Fila en la hoja = índice + 2 (encabezado en la fila 1)
+    pool.set_snapshot(
+        sheet_title, _snapshot(df, all_columns, (df.index + 2).tolist()) if not reparada else None
+    )
+    return df
+
+def _escribir_hoja_operaciones(sh, df_to_save, sheet_title, pool):
+    all_columns = COLUMNAS_OPERACIONES
+    ws = pool.worksheet(sh, sheet_title, all_columns)
+    snapshot = _guardar_incremental(sh, ws, df_to_save, all_columns, pool.snapshot(sheet_title))
+    if snapshot is None:
+        # Sin lectura previa o con cambios de esquema: reescritura completa
+        valores = pd.DataFrame(celdas(df_to_save, all_columns), columns=all_columns)
+        set_with_dataframe(ws, valores, include_index=False, include_column_header=True, resize=True)
+        snapshot = _snapshot(df_to_save, all_columns, list(range(2, len(df_to_save) + 2)))
+    pool.set_snapshot(sheet_title, snapshot or None)
+
+def _aplicar_cambios_operaciones(df, lista_cambios):
+    # Aplica en orden los cambios del registro sobre una lectura de la hoja
+    if not lista_cambios:
+        return df
+    df = df.copy()
+    df.index = df['Consecutivo'].astype(str)
+    df = df.astype(object)
+    for cambios in lista_cambios:
+        df = df.drop(index=[c for c in cambios['deletes'] if c in df.index])
+        if not cambios['upserts']:
+            continue
+        # Todo el lote a la vez (p. ej. una importación masiva): las existentes se reemplazan
+        # en su lugar y las nuevas van al final, en orden; si un consecutivo se repite, gana el último
+        filas = pd.DataFrame([[fila.get(col, "") for col in df.columns] for fila in cambios['upserts']],
+                             columns=df.columns, index=[str(fila['Consecutivo']) for fila in cambios['upserts']],
+                             dtype=object)
+        filas = filas[~filas.index.duplicated(keep='last')]
+        existentes = filas.index.isin(df.index)
+        if existentes.any():
+            df.loc[filas.index[existentes]] = filas[existentes]
+        df = pd.concat([df, filas[~existentes]])
+    return aplicar_esquema(df.reset_index(drop=True))
+
+class SheetsBackend(ReplicaBackend):
+    # Google Sheets como réplica: recibe del registro los mismos cambios que el almacén local
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _spreadsheet(self):
+        sh, _ = self.pool.spreadsheet()
+        if not sh:
+            raise RuntimeError("Hoja de cálculo no disponible")
+        return sh
+
+    def leer_operaciones(self, desde=None, hasta=None, columnas=None, consecutivos=None,
+                         incluir_archivo=False, hoja="operaciones"):
+        # Sheets no filtra en el servidor: se lee la pestaña y se filtra en memoria
+        df = _leer_hoja_operaciones(self._spreadsheet(), hoja, self.pool)
+        if incluir_archivo:
+            df = pd.concat([self.leer_archivo()[0], df], ignore_index=True)
+        return filtrar_operaciones(df, desde, hasta, columnas, consecutivos)
+
+    def guardar_operaciones(self, cambios):
+        # Se coalescen todos los cambios en una sola lectura y una escritura por diferencias por pestaña
+        sh = self._spreadsheet()
+        por_hoja = {}
+        for c in cambios:
+            por_hoja.setdefault(c.get('hoja', "operaciones"), []).append(c)
+        for hoja, lista in por_hoja.items():
+            df = _leer_hoja_operaciones(sh, hoja, self.pool)
+            _escribir_hoja_operaciones(sh, _aplicar_cambios_operaciones(df, lista), hoja, self.pool)
+
+    def _leer_alertas_de(self, ws):
+        df = get_as_dataframe(ws, evaluate_formulas=True)
+        if df is None:
+            df = pd.DataFrame(columns=COLUMNAS_HISTORIAL)
+        df = df.dropna(how="all")
+        for col in COLUMNAS_HISTORIAL:
+            if col not in df.columns:
+                df[col] = ""
+        return df[COLUMNAS_HISTORIAL]
+
+    def leer_alertas(self, incluir_archivo=False):
+        df = self._leer_alertas_de(self.pool.worksheet(self._spreadsheet(), "alertas", COLUMNAS_HISTORIAL))
+        if incluir_archivo:
+            df = pd.concat([self.leer_archivo()[1], df], ignore_index=True)
+        return df
+
+    def _pestanas_archivo(self, tabla):
+        # Pestañas mensuales del archivo: "<tabla>_AAAA-MM"
+        return sorted(
+            (ws for ws in self._spreadsheet().worksheets() if ws.title.startswith(f"{tabla}_")),
+            key=lambda ws: ws.title
+        )
+
+    def leer_archivo(self):
+        operaciones = [aplicar_esquema(get_as_dataframe(ws, evaluate_formulas=True).dropna(how="all"))
+                       for ws in self._pestanas_archivo("operaciones")]
+        alertas = [self._leer_alertas_de(ws) for ws in self._pestanas_archivo("alertas")]
+        return (
+            pd.concat(operaciones, ignore_index=True) if operaciones else aplicar_esquema(pd.DataFrame()),
+            pd.concat(alertas, ignore_index=True) if alertas else pd.DataFrame(columns=COLUMNAS_HISTORIAL),
+        )
+
+    def archivar(self, operaciones, alertas):
+        # Cada fila va a la pestaña de su mes y se borra de la pestaña activa
+        sh = self._spreadsheet()
+        por_mes = {}
+        for fila in operaciones:
+            por_mes.setdefault(f"operaciones_{str(fila['FechaLlegada'])[:7] or 'sin-fecha'}", []).append(
+                [fila.get(c, "") for c in COLUMNAS_OPERACIONES])
+        for fila in alertas:
+            suceso = str(fila[COLUMNAS_HISTORIAL.index('FechaSuceso')])[:7]
+            por_mes.setdefault(f"alertas_{suceso or 'sin-fecha'}", []).append(list(fila))
+        for titulo, filas in sorted(por_mes.items()):
+            encabezado = COLUMNAS_OPERACIONES if titulo.startswith("operaciones_") else COLUMNAS_HISTORIAL
+            self.pool.worksheet(sh, titulo, encabezado).append_rows(filas, value_input_option="USER_ENTERED")
+
+        if operaciones:
+            self.guardar_operaciones([{'upserts': [], 'deletes': [str(f['Consecutivo']) for f in operaciones]}])
+        if alertas:
+            ws = self.pool.worksheet(sh, "alertas", COLUMNAS_HISTORIAL)
+            valores = ws.get_all_values()
+            if not valores:
+                return
+            por_clave = self._filas_por_clave(valores)
+            claves = {tuple(str(f[COLUMNAS_HISTORIAL.index(k)]) for k in CLAVE_ALERTA) for f in alertas}
+            filas = [n for c in claves for n in por_clave.get(c, [])]
+            if filas:
+                _borrar_filas(sh, ws, filas)
+            self.pool.set_snapshot("alertas", None)
+
+    @staticmethod
+    def _filas_por_clave(valores):
+        # {clave: [número de fila, ...]} de una pestaña de alertas leída con get_all_values
+        posiciones = [valores[0].index(k) for k in CLAVE_ALERTA]
+        filas = {}
+        for n, fila in enumerate(valores[1:], start=2):
+            filas.setdefault(tuple(fila[p] if p < len(fila) else "" for p in posiciones), []).append(n)
+        return filas
+
+    def agregar_alertas(self, filas):
+        # Idempotente ante reintentos del replicador: no se anexan claves que ya están en la pestaña
+        ws = self.pool.worksheet(self._spreadsheet(), "alertas", COLUMNAS_HISTORIAL)
+        escritas = self.pool.snapshot("alertas")
+        if escritas is None:
+            valores = ws.get_all_values()
+            escritas = set(self._filas_por_clave(valores)) if valores else set()
+        nuevas = []
+        for fila in filas:
+            clave = tuple(str(fila[COLUMNAS_HISTORIAL.index(k)]) for k in CLAVE_ALERTA)
+            if clave not in escritas:
+                escritas.add(clave)
+                nuevas.append(fila)
+        if nuevas:
+            ws.append_rows(nuevas)
+        self.pool.set_snapshot("alertas", escritas)
+
+    def compactar_alertas(self):
+        # Compactación única de la pestaña: una fila por clave, resuelta si alguna copia lo estaba
+        sh = self._spreadsheet()
+        ws = self.pool.worksheet(sh, "alertas", COLUMNAS_HISTORIAL)
+        valores = ws.get_all_values()
+        if not valores:
+            return
+        from gspread.utils import rowcol_to_a1
+        col = valores[0].index('Resuelta')
+        resueltas, duplicadas = [], []
+        for filas in self._filas_por_clave(valores).values():
+            if len(filas) < 2:
+                continue
+            duplicadas.extend(filas[1:])
+            estados = [str(valores[n - 1][col]).strip().lower() if col < len(valores[n - 1]) else "" for n in filas]
+            if estados[0] not in ("true", "1") and any(e in ("true", "1") for e in estados[1:]):
+                resueltas.append(filas[0])
+        if resueltas:
+            ws.batch_update(
+                [{'range': rowcol_to_a1(n, col + 1), 'values': [[True]]} for n in resueltas],
+                value_input_option="USER_ENTERED"
+            )
+        if duplicadas:
+            _borrar_filas(sh, ws, duplicadas)
+        self.pool.set_snapshot("alertas", None)
+
+    def resolver_alertas(self, claves):
+        # Solo se escriben las celdas Resuelta de las filas cuya clave coincide
+        ws = self.pool.worksheet(self._spreadsheet(), "alertas", COLUMNAS_HISTORIAL)
+        valores = ws.get_all_values()
+        if not valores:
+            return
+        from gspread.utils import rowcol_to_a1
+        col = valores[0].index('Resuelta') + 1
+        por_clave = self._filas_por_clave(valores)
+        filas = [n for c in {tuple(c) for c in claves} for n in por_clave.get(c, [])]
+        if filas:
+            ws.batch_update(
+                [{'range': rowcol_to_a1(n, col), 'values': [[True]]} for n in filas],
+                value_input_option="USER_ENTERED"
+            )
+
+@config.recurso
+def get_replica_sheets():
+    return SheetsBackend(get_sheets_pool())
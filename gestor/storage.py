@@ -0,0 +1,501 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import pandas as pd
+
+COLUMNAS_OPERACIONES = ['Consecutivo', 'Modalidad', 'Tipo', 'Cliente', 'FechaLlegada',
+                        'FechaCertificacionFletes', 'EstadoCertificacionFletes',
+                        'FechaSolicitarLiberacion', 'EstadoSolicitarLiberacion']
+COLUMNAS_FECHA = ['FechaLlegada', 'FechaCertificacionFletes', 'FechaSolicitarLiberacion']
+# Valores válidos de Modalidad y Tipo (formulario e importación)
+MODALIDADES = ["Marítimo", "Aéreo", "Terrestre", "Ferroviario"]
+TIPOS_OPERACION = ["Importación", "Exportación"]
+COLUMNAS_HISTORIAL = ["FechaRegistro", "Consecutivo", "Cliente", "Tipo", "FechaSuceso", "Resuelta"]
+# Clave determinista de una alerta: volver a registrar la misma operación no la duplica
+CLAVE_ALERTA = ["Consecutivo", "Tipo", "FechaSuceso"]
+
+# Valores por consulta IN (...) al filtrar por consecutivo
+LOTE_CONSULTA = 500
+
+# Calendario de alertas materializado: (tipo, días respecto a FechaLlegada) por operación activa
+CALENDARIO_TIPOS = [("Llegada", 0), ("CertificacionFletes", -7), ("SolicitarLiberacion", -2)]
+
+# Tipos con que se cargan las operaciones, sea cual sea el backend; el resto del código los usa tal cual
+ESQUEMA_OPERACIONES = {
+    'Consecutivo': "string",
+    'Modalidad': "category",
+    'Tipo': "category",
+    'Cliente': "category",
+    'FechaLlegada': "datetime64",
+    'FechaCertificacionFletes': "datetime64",
+    'EstadoCertificacionFletes': "category",
+    'FechaSolicitarLiberacion': "datetime64",
+    'EstadoSolicitarLiberacion': "category",
+}
+
+def aplicar_esquema(df, esquema=ESQUEMA_OPERACIONES, formato_fecha=None):
+    # Una sola conversión por columna: texto vacío como "", fechas inválidas como NaT
+    df = df.reindex(columns=list(esquema))
+    for col, tipo in esquema.items():
+        if tipo == "datetime64":
+            df[col] = pd.to_datetime(df[col], format=formato_fecha, errors='coerce')
+        else:
+            texto = df[col].astype(object)
+            df[col] = texto.where(texto.notna(), "").astype(str).astype(tipo)
+    return df
+
+def filtrar_operaciones(df, desde=None, hasta=None, columnas=None, consecutivos=None):
+    # Mismos filtros que leer_operaciones, para backends que no pueden aplicarlos al leer
+    mascara = pd.Series(True, index=df.index)
+    if desde is not None:
+        mascara &= df['FechaLlegada'] >= pd.Timestamp(desde)
+    if hasta is not None:
+        mascara &= df['FechaLlegada'] <= pd.Timestamp(hasta)
+    if consecutivos is not None:
+        mascara &= df['Consecutivo'].isin([str(c) for c in consecutivos])
+    columnas = [c for c in COLUMNAS_OPERACIONES if columnas is None or c in columnas]
+    return df.loc[mascara, columnas].reset_index(drop=True)
+
+def celdas(df, columns):
+    # Valores tal como se escriben en la hoja, para comparar filas leídas y por guardar
+    resultado = pd.DataFrame(index=df.index)
+    for col in columns:
+        if col in COLUMNAS_FECHA:
+            resultado[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime("%Y-%m-%d").fillna("")
+        else:
+            texto = df[col].astype(object)
+            resultado[col] = texto.where(texto.notna(), "").astype(str).replace({"nan": "", "NaT": "", "None": ""})
+    return resultado.values.tolist()
+
+class StorageBackend(ABC):
+    # Interfaz común del almacén primario y de las réplicas (p. ej. Google Sheets).
+    # Las operaciones viajan como celdas de texto ("" = vacío, fechas "%Y-%m-%d") y
+    # los cambios como lista ordenada de {'upserts': [dict], 'deletes': [consecutivo]}.
+    # leer_operaciones acepta una ventana de FechaLlegada, una proyección de columnas y
+    # una lista de consecutivos; sin argumentos devuelve toda la tabla activa, y con
+    # incluir_archivo también lo archivado.
+    # archivar mueve las filas dadas (celdas / valores) de las tablas activas al archivo.
+    # Un backend al que le falte algún método de su interfaz no se puede instanciar.
+    @abstractmethod
+    def leer_operaciones(self, desde=None, hasta=None, columnas=None, consecutivos=None, incluir_archivo=False):
+        ...
+
+    @abstractmethod
+    def guardar_operaciones(self, cambios):
+        ...
+
+    @abstractmethod
+    def leer_alertas(self, incluir_archivo=False):
+        ...
+
+    @abstractmethod
+    def agregar_alertas(self, filas):
+        ...
+
+    @abstractmethod
+    def resolver_alertas(self, claves):
+        ...
+
+    @abstractmethod
+    def archivar(self, operaciones, alertas):
+        ...
+
+class PrimaryBackend(StorageBackend):
+    # Almacén primario: lo que la UI y las tareas leen. Además del historial por ventana de FechaSuceso,
+    # mantiene el calendario de alertas, decide qué se archiva y recibe la copia inicial desde una réplica.
+    @abstractmethod
+    def leer_alertas(self, incluir_archivo=False, desde=None, hasta=None):
+        ...
+
+    @abstractmethod
+    def vacio(self):
+        ...
+
+    @abstractmethod
+    def leer_calendario(self, desde=None, hasta=None):
+        ...
+
+    @abstractmethod
+    def archivables(self, corte, corte_cerradas=None, estados_cerrados=(), corte_alertas=None):
+        ...
+
+    @abstractmethod
+    def agregar_archivo(self, operaciones, alertas):
+        ...
+
+class ReplicaBackend(StorageBackend):
+    # Réplica que recibe los cambios del registro: entrega su archivo para hidratar un almacén
+    # vacío y compacta su historial cuando el primario encontró duplicados.
+    @abstractmethod
+    def leer_archivo(self):
+        ...
+
+    @abstractmethod
+    def compactar_alertas(self):
+        ...
+
+class SqliteBackend(PrimaryBackend):
+    # Almacén local tipado: operaciones indexadas por Consecutivo y FechaLlegada, alertas por clave
+    def __init__(self, path, csv_operaciones=None, csv_alertas=None):
+        self.path = path
+        self._lock = threading.Lock()
+        # Alertas duplicadas eliminadas al abrir (compactación única o migración del CSV)
+        self.compactadas = 0
+        with self._connect() as conn:
+            sin_clave = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'alertas_clave'").fetchone() is None
+            # Tablas activas y su archivo (misma estructura, solo se consulta bajo demanda)
+            for sufijo in ("", "_archivo"):
+                self.compactadas += self._crear_tablas(conn, sufijo)
+            if sin_clave:
+                # Una alerta ya archivada no sigue además en la tabla activa
+                self.compactadas += conn.execute(
+                    f"DELETE FROM alertas WHERE EXISTS (SELECT 1 FROM alertas_archivo a WHERE "
+                    f"{' AND '.join(f'a.{k} = alertas.{k}' for k in CLAVE_ALERTA)})"
+                ).rowcount
+            # Bases creadas antes del calendario: se llena una sola vez con las operaciones activas
+            nuevo = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'calendario'").fetchone() is None
+            conn.execute("CREATE TABLE IF NOT EXISTS calendario ("
+                         "fecha TEXT NOT NULL, tipo TEXT NOT NULL, Consecutivo TEXT NOT NULL, "
+                         "PRIMARY KEY (fecha, tipo, Consecutivo)) WITHOUT ROWID")
+            conn.execute("CREATE INDEX IF NOT EXISTS calendario_consecutivo ON calendario (Consecutivo)")
+            if nuevo:
+                self._recalcular_calendario(conn)
+        if csv_operaciones:
+            self._migrar_csv_operaciones(csv_operaciones)
+        if csv_alertas:
+            self._migrar_csv_alertas(csv_alertas)
+
+    @staticmethod
+    def _compactar_alertas(conn, tabla):
+        # Una fila por clave (la primera registrada), resuelta si alguna de sus copias lo estaba
+        iguales = " AND ".join(f"d.{k} = {tabla}.{k}" for k in CLAVE_ALERTA)
+        conn.execute(f"UPDATE {tabla} SET Resuelta = 1 WHERE Resuelta = 0 AND EXISTS "
+                     f"(SELECT 1 FROM {tabla} d WHERE {iguales} AND d.Resuelta = 1)")
+        return conn.execute(f"DELETE FROM {tabla} WHERE id NOT IN "
+                            f"(SELECT MIN(id) FROM {tabla} GROUP BY {', '.join(CLAVE_ALERTA)})").rowcount
+
+    @staticmethod
+    def _crear_tablas(conn, sufijo):
+        # Devuelve cuántas alertas duplicadas se compactaron (solo la primera vez)
+        columnas = ", ".join(
+            f'"{c}" TEXT PRIMARY KEY' if c == 'Consecutivo' else
+            f'"{c}" TEXT' if c in COLUMNAS_FECHA else
+            f'"{c}" TEXT NOT NULL DEFAULT \'\''
+            for c in COLUMNAS_OPERACIONES
+        )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS operaciones{sufijo} ({columnas})")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS operaciones{sufijo}_llegada ON operaciones{sufijo} ("FechaLlegada")')
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS alertas{sufijo} ("
+            "id INTEGER PRIMARY KEY, "
+            "FechaRegistro TEXT NOT NULL DEFAULT '', "
+            "Consecutivo TEXT NOT NULL DEFAULT '', "
+            "Cliente TEXT NOT NULL DEFAULT '', "
+            "Tipo TEXT NOT NULL DEFAULT '', "
+            "FechaSuceso TEXT NOT NULL DEFAULT '', "
+            "Resuelta INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS alertas{sufijo}_consecutivo ON alertas{sufijo} (Consecutivo, FechaSuceso)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS alertas{sufijo}_suceso ON alertas{sufijo} (FechaSuceso)")
+        compactadas = 0
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                        (f"alertas{sufijo}_clave",)).fetchone() is None:
+            # Historial escrito antes de la clave única: se compacta una sola vez
+            compactadas = SqliteBackend._compactar_alertas(conn, f"alertas{sufijo}")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS alertas{sufijo}_clave ON alertas{sufijo} ({', '.join(CLAVE_ALERTA)})")
+        return compactadas
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _texto(valor):
+        if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+            return ""
+        return str(valor)
+
+    @staticmethod
+    def _fecha(valor):
+        texto = SqliteBackend._texto(valor)[:10]
+        return texto or None
+
+    def _fila_operacion(self, fila):
+        return tuple(
+            self._fecha(fila.get(c)) if c in COLUMNAS_FECHA else self._texto(fila.get(c))
+            for c in COLUMNAS_OPERACIONES
+        )
+
+    def _fila_alerta(self, fila):
+        # fila en el orden de COLUMNAS_HISTORIAL
+        registro, consecutivo, cliente, tipo, suceso, resuelta = fila
+        return (self._texto(registro), self._texto(consecutivo), self._texto(cliente), self._texto(tipo),
+                self._fecha(suceso) or "", int(self._texto(resuelta).strip().lower() in ("true", "1", "1.0")))
+
+    def _vacia(self, conn, tabla):
+        # Sin filas activas ni archivadas
+        return all(conn.execute(f"SELECT 1 FROM {t} LIMIT 1").fetchone() is None for t in (tabla, f"{tabla}_archivo"))
+
+    def vacio(self):
+        with self._connect() as conn:
+            return self._vacia(conn, "operaciones") and self._vacia(conn, "alertas")
+
+    def _migrar_csv_operaciones(self, csv_path):
+        # Migración única desde el operaciones.csv que se reescribía completo en cada guardado
+        if not os.path.exists(csv_path):
+            return
+        with self._lock, self._connect() as conn:
+            if not self._vacia(conn, "operaciones"):
+                return
+            try:
+                df = pd.read_csv(csv_path, encoding='utf-8', dtype=str)
+            except Exception:
+                return
+            df = df.reindex(columns=COLUMNAS_OPERACIONES).dropna(subset=['Consecutivo'])
+            for col in COLUMNAS_FECHA:
+                df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime("%Y-%m-%d")
+            df = df.drop_duplicates(subset='Consecutivo', keep='last')
+            conn.executemany(self._sql_upsert(), [self._fila_operacion(f) for f in df.to_dict('records')])
+            self._recalcular_calendario(conn)
+
+    def _migrar_csv_alertas(self, csv_path):
+        if not os.path.exists(csv_path):
+            return
+        with self._lock, self._connect() as conn:
+            if not self._vacia(conn, "alertas"):
+                return
+            try:
+                df = pd.read_csv(csv_path, encoding='utf-8', dtype=str)
+            except Exception:
+                return
+            # Formato anterior (Fecha, Consecutivo, Cliente, Alerta)
+            df = df.rename(columns={'Fecha': 'FechaSuceso', 'Alerta': 'Tipo'}).reindex(columns=COLUMNAS_HISTORIAL)
+            filas = [self._fila_alerta(f) for f in df.values.tolist()]
+            conn.executemany(self._sql_alerta(), filas)
+            self.compactadas += len(filas) - len({self._clave(f) for f in filas})
+
+    @staticmethod
+    def _sql_upsert(tabla="operaciones"):
+        columnas = ", ".join(f'"{c}"' for c in COLUMNAS_OPERACIONES)
+        marcas = ", ".join("?" for _ in COLUMNAS_OPERACIONES)
+        asignaciones = ", ".join(f'"{c}" = excluded."{c}"' for c in COLUMNAS_OPERACIONES[1:])
+        return (f"INSERT INTO {tabla} ({columnas}) VALUES ({marcas}) "
+                f'ON CONFLICT("Consecutivo") DO UPDATE SET {asignaciones}')
+
+    @staticmethod
+    def _sql_alerta(tabla="alertas"):
+        # Upsert por clave: se conserva la primera fila y solo puede pasar a resuelta
+        columnas = ", ".join(COLUMNAS_HISTORIAL)
+        return (f"INSERT INTO {tabla} ({columnas}) VALUES ({', '.join('?' for _ in COLUMNAS_HISTORIAL)}) "
+                f"ON CONFLICT({', '.join(CLAVE_ALERTA)}) DO UPDATE SET Resuelta = max(Resuelta, excluded.Resuelta)")
+
+    @staticmethod
+    def _clave(fila):
+        # fila normalizada por _fila_alerta
+        return tuple(fila[COLUMNAS_HISTORIAL.index(k)] for k in CLAVE_ALERTA)
+
+    def _claves_existentes(self, conn, tabla, claves):
+        # Claves ya guardadas en la tabla, consultadas por lotes de consecutivos
+        consecutivos = sorted({c[0] for c in claves})
+        existentes = set()
+        for i in range(0, len(consecutivos), LOTE_CONSULTA):
+            lote = consecutivos[i:i + LOTE_CONSULTA]
+            existentes.update(conn.execute(
+                f"SELECT {', '.join(CLAVE_ALERTA)} FROM {tabla} WHERE Consecutivo IN ({', '.join('?' for _ in lote)})",
+                lote
+            ).fetchall())
+        return existentes & set(claves)
+
+    def leer_operaciones(self, desde=None, hasta=None, columnas=None, consecutivos=None, incluir_archivo=False):
+        # La ventana de fechas usa el índice de FechaLlegada y los consecutivos la clave primaria
+        columnas = [c for c in COLUMNAS_OPERACIONES if columnas is None or c in columnas]
+        condiciones, parametros = [], []
+        if desde is not None:
+            condiciones.append('"FechaLlegada" >= ?')
+            parametros.append(self._fecha(desde))
+        if hasta is not None:
+            condiciones.append('"FechaLlegada" <= ?')
+            parametros.append(self._fecha(hasta))
+        seleccion = ", ".join(f'"{c}"' for c in columnas)
+        tablas = ["operaciones_archivo", "operaciones"] if incluir_archivo else ["operaciones"]
+
+        partes = []
+        with self._connect() as conn:
+            for tabla in tablas:
+                sql = f"SELECT {seleccion} FROM {tabla}"
+                if consecutivos is None:
+                    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+                    partes.append(pd.read_sql_query(sql + where + " ORDER BY rowid", conn, params=parametros))
+                    continue
+                # Por lotes para no pasar el límite de parámetros de SQLite
+                consecutivos = [str(c) for c in consecutivos]
+                partes.append(pd.read_sql_query(sql + " LIMIT 0", conn))
+                for i in range(0, len(consecutivos), LOTE_CONSULTA):
+                    lote = consecutivos[i:i + LOTE_CONSULTA]
+                    where = " AND ".join(condiciones + [f'"Consecutivo" IN ({", ".join("?" for _ in lote)})'])
+                    partes.append(pd.read_sql_query(f"{sql} WHERE {where}", conn, params=parametros + lote))
+        df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+        esquema = {c: ESQUEMA_OPERACIONES[c] for c in columnas}
+        return aplicar_esquema(df, esquema, formato_fecha="%Y-%m-%d")
+
+    def _llegadas(self, conn, consecutivos):
+        llegadas = {}
+        for i in range(0, len(consecutivos), LOTE_CONSULTA):
+            lote = consecutivos[i:i + LOTE_CONSULTA]
+            llegadas.update(conn.execute(
+                f'SELECT "Consecutivo", "FechaLlegada" FROM operaciones '
+                f'WHERE "Consecutivo" IN ({", ".join("?" for _ in lote)})', lote
+            ).fetchall())
+        return llegadas
+
+    def _recalcular_calendario(self, conn, consecutivos=None):
+        # Entradas del calendario a partir de la FechaLlegada guardada (todas o solo las dadas)
+        if consecutivos is None:
+            conn.execute("DELETE FROM calendario")
+        else:
+            conn.executemany("DELETE FROM calendario WHERE Consecutivo = ?", [(c,) for c in consecutivos])
+        sql = ('INSERT OR REPLACE INTO calendario (fecha, tipo, Consecutivo) '
+               'SELECT date("FechaLlegada", ?), ?, "Consecutivo" FROM operaciones '
+               'WHERE date("FechaLlegada", ?) IS NOT NULL')
+        for tipo, dias in CALENDARIO_TIPOS:
+            desfase = f"{dias:+d} days"
+            if consecutivos is None:
+                conn.execute(sql, (desfase, tipo, desfase))
+            else:
+                conn.executemany(sql + ' AND "Consecutivo" = ?', [(desfase, tipo, desfase, c) for c in consecutivos])
+
+    def guardar_operaciones(self, cambios):
+        # Solo se tocan las filas afectadas; todo el lote en una transacción.
+        # El calendario solo se recalcula para las operaciones cuya FechaLlegada cambió.
+        with self._lock, self._connect() as conn:
+            for c in cambios:
+                if c.get('deletes'):
+                    borrados = [(str(cons),) for cons in c['deletes']]
+                    conn.executemany('DELETE FROM operaciones WHERE "Consecutivo" = ?', borrados)
+                    conn.executemany("DELETE FROM calendario WHERE Consecutivo = ?", borrados)
+                if c.get('upserts'):
+                    filas = [self._fila_operacion(f) for f in c['upserts']]
+                    previas = self._llegadas(conn, [f[0] for f in filas])
+                    llegada = COLUMNAS_OPERACIONES.index('FechaLlegada')
+                    movidas = [f[0] for f in filas if f[0] not in previas or previas[f[0]] != f[llegada]]
+                    conn.executemany(self._sql_upsert(), filas)
+                    if movidas:
+                        self._recalcular_calendario(conn, list(dict.fromkeys(movidas)))
+
+    def leer_calendario(self, desde=None, hasta=None):
+        # Búsqueda por rango sobre la clave (fecha, tipo, Consecutivo), ya ordenada por fecha
+        condiciones, parametros = [], []
+        if desde is not None:
+            condiciones.append("c.fecha >= ?")
+            parametros.append(self._fecha(desde))
+        if hasta is not None:
+            condiciones.append("c.fecha <= ?")
+            parametros.append(self._fecha(hasta))
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                'SELECT c.fecha AS Fecha, c.tipo AS Tipo, c.Consecutivo, o."Cliente", o."FechaLlegada" AS ETA '
+                f'FROM calendario c JOIN operaciones o ON o."Consecutivo" = c.Consecutivo{where} '
+                "ORDER BY c.fecha", conn, params=parametros
+            )
+        df['Fecha'] = pd.to_datetime(df['Fecha'], format="%Y-%m-%d")
+        df['ETA'] = pd.to_datetime(df['ETA'], format="%Y-%m-%d", errors='coerce')
+        return df
+
+    def leer_alertas(self, incluir_archivo=False, desde=None, hasta=None):
+        # La ventana de FechaSuceso usa su índice
+        condiciones, parametros = [], []
+        if desde is not None:
+            condiciones.append("FechaSuceso >= ?")
+            parametros.append(self._fecha(desde))
+        if hasta is not None:
+            condiciones.append("FechaSuceso <= ?")
+            parametros.append(self._fecha(hasta))
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        tablas = ["alertas_archivo", "alertas"] if incluir_archivo else ["alertas"]
+        with self._connect() as conn:
+            df = pd.concat([
+                pd.read_sql_query(f"SELECT {', '.join(COLUMNAS_HISTORIAL)} FROM {tabla}{where} ORDER BY id", conn,
+                                  params=parametros)
+                for tabla in tablas
+            ], ignore_index=True)
+        df['FechaSuceso'] = pd.to_datetime(df['FechaSuceso'], format="%Y-%m-%d", errors='coerce').dt.date
+        df['Resuelta'] = df['Resuelta'].astype(bool)
+        return df
+
+    def agregar_alertas(self, filas):
+        # Idempotente: devuelve solo las filas con clave nueva (las que hay que replicar).
+        # Las claves ya archivadas no vuelven a la tabla activa.
+        if not filas:
+            return []
+        normalizadas = {}
+        for fila in filas:
+            f = self._fila_alerta(fila)
+            previa = normalizadas.get(self._clave(f))
+            normalizadas[self._clave(f)] = f if previa is None else previa[:-1] + (max(previa[-1], f[-1]),)
+        with self._lock, self._connect() as conn:
+            archivadas = self._claves_existentes(conn, "alertas_archivo", list(normalizadas))
+            existentes = self._claves_existentes(conn, "alertas", list(normalizadas)) | archivadas
+            conn.executemany(self._sql_alerta(), [f for clave, f in normalizadas.items() if clave not in archivadas])
+        return [list(f[:-1]) + [bool(f[-1])] for clave, f in normalizadas.items() if clave not in existentes]
+
+    def resolver_alertas(self, claves):
+        if not claves:
+            return
+        condicion = " AND ".join(f"{k} = ?" for k in CLAVE_ALERTA)
+        with self._lock, self._connect() as conn:
+            conn.executemany(f"UPDATE alertas SET Resuelta = 1 WHERE {condicion}",
+                             [tuple(str(v) for v in clave) for clave in claves])
+
+    def archivables(self, corte, corte_cerradas=None, estados_cerrados=(), corte_alertas=None):
+        # Operaciones con llegada anterior a corte (o cerradas antes de corte_cerradas) y
+        # alertas resueltas con suceso anterior a corte_alertas
+        columnas = ", ".join(f'"{c}"' for c in COLUMNAS_OPERACIONES)
+        condicion = '"FechaLlegada" < ?'
+        parametros = [self._fecha(corte)]
+        if corte_cerradas is not None and estados_cerrados:
+            marcas = ", ".join("?" for _ in estados_cerrados)
+            condicion += (f' OR ("FechaLlegada" < ?'
+                          f' AND lower(trim("EstadoCertificacionFletes")) IN ({marcas})'
+                          f' AND lower(trim("EstadoSolicitarLiberacion")) IN ({marcas}))')
+            parametros += [self._fecha(corte_cerradas)] + list(estados_cerrados) * 2
+        with self._connect() as conn:
+            filas = conn.execute(f"SELECT {columnas} FROM operaciones WHERE {condicion}", parametros).fetchall()
+            alertas = []
+            if corte_alertas is not None:
+                alertas = conn.execute(
+                    f"SELECT {', '.join(COLUMNAS_HISTORIAL)} FROM alertas WHERE Resuelta = 1 AND FechaSuceso < ?",
+                    (self._fecha(corte_alertas),)
+                ).fetchall()
+        operaciones = [{c: "" if v is None else v for c, v in zip(COLUMNAS_OPERACIONES, f)} for f in filas]
+        return operaciones, [list(f[:-1]) + [bool(f[-1])] for f in alertas]
+
+    def archivar(self, operaciones, alertas):
+        # Mueve las filas al archivo en una transacción: las tablas activas quedan pequeñas
+        consecutivos = [(str(f['Consecutivo']),) for f in operaciones]
+        claves = [tuple(self._texto(f[COLUMNAS_HISTORIAL.index(k)]) for k in CLAVE_ALERTA) for f in alertas]
+        columnas = ", ".join(f'"{c}"' for c in COLUMNAS_OPERACIONES)
+        condicion = " AND ".join(f"{k} = ?" for k in CLAVE_ALERTA)
+        with self._lock, self._connect() as conn:
+            conn.executemany(f'INSERT OR REPLACE INTO operaciones_archivo ({columnas}) '
+                             f'SELECT {columnas} FROM operaciones WHERE "Consecutivo" = ?', consecutivos)
+            conn.executemany('DELETE FROM operaciones WHERE "Consecutivo" = ?', consecutivos)
+            conn.executemany("DELETE FROM calendario WHERE Consecutivo = ?", consecutivos)
+            conn.executemany(f"INSERT OR IGNORE INTO alertas_archivo ({', '.join(COLUMNAS_HISTORIAL)}) "
+                             f"SELECT {', '.join(COLUMNAS_HISTORIAL)} FROM alertas WHERE {condicion}", claves)
+            conn.executemany(f"DELETE FROM alertas WHERE {condicion}", claves)
+
+    def agregar_archivo(self, operaciones, alertas):
+        # Carga directa al archivo (p. ej. al hidratar desde las pestañas mensuales de Sheets)
+        with self._lock, self._connect() as conn:
+            conn.executemany(self._sql_upsert("operaciones_archivo"), [self._fila_operacion(f) for f in operaciones])
+            conn.executemany(self._sql_alerta("alertas_archivo"), [self._fila_alerta(f) for f in alertas])
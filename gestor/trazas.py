@@ -0,0 +1,233 @@
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# Trazas por rerun: tramos con su duración, llamadas remotas y bytes transferidos.
+# Cada rerun (o tarea en segundo plano) se escribe como una línea JSON en un archivo rotativo.
+
+_logger = logging.getLogger("gestor.trazas")
+_logger.propagate = False
+_config_lock = threading.Lock()
+_local = threading.local()
+
+def configurar(path, max_bytes=5 * 1024 * 1024, copias=3):
+    # Idempotente: Streamlit vuelve a ejecutar el script en cada interacción
+    with _config_lock:
+        if any(getattr(h, "baseFilename", None) and h.baseFilename.endswith(path) for h in _logger.handlers):
+            return
+        for h in list(_logger.handlers):
+            _logger.removeHandler(h)
+            h.close()
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=copias, encoding='utf-8')
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+
+class Traza:
+    def __init__(self, etiqueta):
+        self.id = uuid.uuid4().hex[:12]
+        self.etiqueta = etiqueta
+        self.ts = datetime.now().isoformat(timespec="seconds")
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.tramos = []
+        self.abiertos = []
+        self.llamadas = 0
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        self.estado = "ok"
+        # Los hilos de un rerun suman aquí sus tramos mientras el rerun sigue abriendo y cerrando los suyos
+        self._lock = threading.RLock()
+
+    def abrir(self, nombre):
+        with self._lock:
+            return self._abrir(nombre)
+
+    def _abrir(self, nombre):
+        tramo = {"nombre": nombre, "nivel": len(self.abiertos),
+                 "inicio_ms": round((time.perf_counter() - self.inicio) * 1000, 1),
+                 "ms": None, "llamadas": 0, "bytes_enviados": 0, "bytes_recibidos": 0,
+                 "_t0": time.perf_counter()}
+        self.tramos.append(tramo)
+        self.abiertos.append(tramo)
+        return tramo
+
+    def cerrar(self, tramo, error=None):
+        with self._lock:
+            self._cerrar(tramo, error)
+
+    def _cerrar(self, tramo, error=None):
+        # Identidad, no igualdad: dos tramos pueden tener el mismo contenido
+        abiertos = [t for t in self.abiertos if t is not tramo]
+        if len(abiertos) == len(self.abiertos):
+            return
+        self.abiertos = abiertos
+        tramo["ms"] = round((time.perf_counter() - tramo.pop("_t0")) * 1000, 1)
+        if error is not None:
+            tramo["error"] = type(error).__name__
+
+    def fase(self, nombre):
+        # Las fases son tramos de primer nivel consecutivos: abrir una cierra la anterior
+        with self._lock:
+            while self.abiertos:
+                self._cerrar(self.abiertos[-1])
+            return self._abrir(nombre)
+
+    def contar(self, enviados, recibidos):
+        with self._lock:
+            self.llamadas += 1
+            self.bytes_enviados += enviados
+            self.bytes_recibidos += recibidos
+            for tramo in self.abiertos:
+                tramo["llamadas"] += 1
+                tramo["bytes_enviados"] += enviados
+                tramo["bytes_recibidos"] += recibidos
+
+    def sumar(self, hija):
+        # Tramos y llamadas de una traza hija (trabajo del rerun en otro hilo), un nivel por debajo
+        # y en el tiempo del rerun. Devuelve False si el rerun ya terminó y se escribió sin ella.
+        with self._lock:
+            if self.fin is not None:
+                return False
+            desfase = (hija.inicio - self.inicio) * 1000
+            for t in hija.tramos:
+                self.tramos.append({**t, "nivel": t["nivel"] + 1, "inicio_ms": round(t["inicio_ms"] + desfase, 1),
+                                    "hilo": hija.etiqueta})
+            self.llamadas += hija.llamadas
+            self.bytes_enviados += hija.bytes_enviados
+            self.bytes_recibidos += hija.bytes_recibidos
+            return True
+
+    def terminar(self, estado=None):
+        with self._lock:
+            while self.abiertos:
+                self._cerrar(self.abiertos[-1])
+            if estado:
+                self.estado = estado
+            self.fin = time.perf_counter()
+            return self
+
+    def ms(self):
+        return round(((self.fin or time.perf_counter()) - self.inicio) * 1000, 1)
+
+    def registro(self):
+        with self._lock:
+            return self._registro()
+
+    def _registro(self):
+        return {"ts": self.ts, "id": self.id, "etiqueta": self.etiqueta, "estado": self.estado,
+                "ms": self.ms(), "llamadas": self.llamadas, "bytes_enviados": self.bytes_enviados,
+                "bytes_recibidos": self.bytes_recibidos,
+                "tramos": [{k: v for k, v in t.items() if not k.startswith("_")} for t in self.tramos]}
+
+def _escribir(traza):
+    if _logger.handlers:
+        try:
+            _logger.info(json.dumps(traza.registro(), ensure_ascii=False, default=str))
+        except Exception:
+            pass
+
+def actual():
+    return getattr(_local, "traza", None)
+
+def iniciar(etiqueta, previa=None):
+    # Un rerun cortado por st.rerun() o por un error no llega a terminar(): se cierra aquí.
+    # 'previa' cubre el caso en que el rerun siguiente de la sesión corre en otro hilo.
+    for t in {id(t): t for t in (actual(), previa) if t is not None}.values():
+        if t.fin is None:
+            _escribir(t.terminar("interrumpida"))
+    _local.traza = Traza(etiqueta)
+    return _local.traza
+
+def terminar():
+    traza = actual()
+    _local.traza = None
+    if traza is not None:
+        _escribir(traza.terminar())
+    return traza
+
+def fase(nombre):
+    traza = actual()
+    if traza is not None:
+        traza.fase(nombre)
+
+def error(nombre, e):
+    # Error que se maneja sin cortar el rerun: queda como un tramo marcado en la traza actual
+    traza = actual()
+    if traza is not None:
+        traza.cerrar(traza.abrir(nombre), e)
+
+@contextmanager
+def tramo(nombre):
+    # Fuera de un rerun (hilos en segundo plano) el tramo más externo abre su propia traza
+    propia = actual() is None
+    traza = iniciar(nombre) if propia else actual()
+    t = traza.abrir(nombre)
+    try:
+        yield t
+    except BaseException as e:
+        traza.cerrar(t, e)
+        if propia:
+            _local.traza = None
+            _escribir(traza.terminar("error"))
+        raise
+    traza.cerrar(t)
+    if propia:
+        terminar()
+
+@contextmanager
+def en_hilo(padre, nombre):
+    # Trabajo de un rerun hecho en otro hilo: se traza aparte y, al terminar, sus tramos y llamadas
+    # se suman a la traza del rerun (o se escribe sola si el rerun ya terminó)
+    if padre is None:
+        with tramo(nombre) as t:
+            yield t
+        return
+    traza = _local.traza = Traza(nombre)
+    t = traza.abrir(nombre)
+    fallo = None
+    try:
+        yield t
+    except BaseException as e:
+        fallo = e
+        raise
+    finally:
+        traza.cerrar(t, fallo)
+        _local.traza = None
+        traza.terminar("error" if fallo is not None else None)
+        if not padre.sumar(traza):
+            _escribir(traza)
+
+def trazado(nombre=None):
+    def decorador(func):
+        etiqueta = nombre or func.__name__
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            with tramo(etiqueta):
+                return func(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def registrar_respuesta(respuesta, *args, **kwargs):
+    # Hook de requests: cuenta cada llamada remota y sus bytes en la traza del hilo actual
+    traza = actual()
+    if traza is not None:
+        try:
+            cuerpo = respuesta.request.body or b""
+            enviados = len(cuerpo) if isinstance(cuerpo, (bytes, str)) else 0
+            recibidos = int(respuesta.headers.get("Content-Length") or len(respuesta.content))
+        except Exception:
+            enviados, recibidos = 0, 0
+        traza.contar(enviados, recibidos)
+    return respuesta
+
+def instrumentar_sesion(sesion):
+    if sesion is not None and registrar_respuesta not in sesion.hooks["response"]:
+        sesion.hooks["response"].append(registrar_respuesta)
+    return sesion
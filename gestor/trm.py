@@ -0,0 +1,272 @@
+import random
+import threading
+import time as _time
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+
+from gestor import config, trazas
+from gestor.config import TIMEZONE, TRM_PUBLICACION, TRM_DB, TRM_HISTORY
+from gestor.trm_store import TrmStore
+
+# Llamadas a datos.gov.co medidas como tramos; el scraper (y requests) se importa al primer uso
+@trazas.trazado()
+def obtener_trm_oficial(fecha):
+    from gestor.scraper import obtener_trm_oficial as _obtener_trm_oficial
+    return _obtener_trm_oficial(fecha)
+
+@trazas.trazado()
+def obtener_trm_rango(inicio, fin):
+    from gestor.scraper import obtener_trm_rango as _obtener_trm_rango
+    return _obtener_trm_rango(inicio, fin)
+
+# -------------------------------
+# Manejo de TRM
+# -------------------------------
+class TrmCache:
+    # Valores publicados se guardan para siempre; los fallos (aún sin publicar o sin datos, da igual
+    # para quien lee: se usa la última TRM conocida) vencen en la próxima publicación
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+        # fecha -> momento en que vence el fallo
+        self._fallos = {}
+
+    def get(self, fecha):
+        key = fecha.strftime("%Y-%m-%d")
+        with self._lock:
+            if key in self._valores:
+                return True, self._valores[key]
+            expira = self._fallos.get(key)
+            if expira is not None:
+                if _time.time() < expira:
+                    return True, None
+                del self._fallos[key]
+        return False, None
+
+    def set_valor(self, fecha, trm):
+        key = fecha.strftime("%Y-%m-%d")
+        with self._lock:
+            self._valores[key] = trm
+            self._fallos.pop(key, None)
+
+    def set_fallo(self, fecha):
+        expira = _time.time() + seconds_until_next_trm(*TRM_PUBLICACION)
+        with self._lock:
+            self._fallos[fecha.strftime("%Y-%m-%d")] = expira
+
+@config.recurso
+def get_trm_cache():
+    return TrmCache()
+
+@config.recurso
+def get_trm_store():
+    return TrmStore(TRM_DB, csv_legacy=TRM_HISTORY)
+
+def save_trm_history(fecha, trm_val):
+    get_trm_store().upsert(fecha, trm_val)
+
+def save_trm_history_lote(valores):
+    get_trm_store().upsert_many(valores)
+
+def last_known_trm(fecha=None):
+    # TRM vigente en la fecha indicada (por defecto hoy), no la última anexada
+    return get_trm_store().on_or_before(fecha or datetime.now(TIMEZONE).date())
+
+def obtener_trm_cached(fecha, consultar_red=True):
+    cache = get_trm_cache()
+    hit, trm = cache.get(fecha)
+    if hit:
+        return trm if trm else (last_known_trm(fecha) or 0.0)
+    
+    # Valores ya persistidos (p. ej. por el prefetcher) no tocan la red
+    trm = get_trm_store().get(fecha)
+    if trm is not None and trm > 0:
+        cache.set_valor(fecha, trm)
+        return trm
+    
+    if not consultar_red:
+        return last_known_trm(fecha) or 0.0
+    
+    try:
+        trm = obtener_trm_oficial(fecha)
+        if trm is not None and trm > 0:
+            cache.set_valor(fecha, trm)
+            save_trm_history(fecha, trm)
+            return trm
+        cache.set_fallo(fecha)
+    except Exception:
+        # Fallo de red (TrmApiError): no se guarda como "sin datos" para reintentar pronto
+        pass
+    
+    return last_known_trm(fecha) or 0.0
+
+def precargar_trm_rango(inicio, fin):
+    # Llena la caché de TRM para todo el rango con una sola consulta a datos.gov.co
+    cache = get_trm_cache()
+    persistidos = get_trm_store().rango(inicio, fin)
+    fechas = [inicio + timedelta(days=i) for i in range((fin - inicio).days + 1)]
+    pendientes = []
+    for f in fechas:
+        if f in persistidos:
+            cache.set_valor(f, persistidos[f])
+        elif not cache.get(f)[0]:
+            pendientes.append(f)
+    if not pendientes:
+        return
+    
+    try:
+        valores = obtener_trm_rango(min(pendientes), max(pendientes))
+    except Exception:
+        valores = None
+    if valores is None:
+        return
+    
+    nuevos = {f: trm for f, trm in valores.items() if trm is not None and trm > 0}
+    save_trm_history_lote(nuevos)
+    for f in pendientes:
+        if f in nuevos:
+            cache.set_valor(f, nuevos[f])
+        else:
+            cache.set_fallo(f)
+
+def sincronizar_trm(inicio, fin):
+    # Para tareas programadas: persiste las TRM que falten en el rango con una sola consulta.
+    # A diferencia de la precarga, un fallo de la API se informa. Devuelve {fecha: trm} de lo nuevo.
+    persistidos = get_trm_store().rango(inicio, fin)
+    faltantes = [inicio + timedelta(days=i) for i in range((fin - inicio).days + 1)
+                 if inicio + timedelta(days=i) not in persistidos]
+    if not faltantes:
+        return {}
+    valores = obtener_trm_rango(min(faltantes), max(faltantes))
+    if valores is None:
+        raise RuntimeError("No se pudo consultar la TRM en datos.gov.co")
+    nuevos = {f: trm for f, trm in valores.items() if f not in persistidos and trm is not None and trm > 0}
+    save_trm_history_lote(nuevos)
+    return nuevos
+
+# -------------------------------
+# Funciones de utilidad
+# -------------------------------
+def seconds_until_next_trm(target_hour=14, target_minute=0):
+    now = datetime.now(TIMEZONE)
+    today_target = TIMEZONE.localize(datetime.combine(now.date(), time(hour=target_hour, minute=target_minute)))
+    
+    if now >= today_target:
+        tomorrow = now.date() + timedelta(days=1)
+        next_target = TIMEZONE.localize(datetime.combine(tomorrow, time(hour=target_hour, minute=target_minute)))
+    else:
+        next_target = today_target
+    
+    return int((next_target - now).total_seconds())
+
+def human_readable_countdown(sec):
+    if sec <= 0:
+        return "0s"
+    m, s = divmod(sec, 60)
+    h, m = divmod(m, 60)
+    parts = []
+    if h: parts.append(f"{h}h")
+    if m: parts.append(f"{m}m")
+    parts.append(f"{s}s")
+    return " ".join(parts)
+
+def sugerir_mejor_dia(fecha_llegada, trm_hoy_manual=None, trm_manana_manual=None):
+    dia_antes = fecha_llegada - timedelta(days=1)
+    dia_llegada = fecha_llegada
+    dia_despues = fecha_llegada + timedelta(days=1)
+
+    trm_ayer = obtener_trm_cached(dia_antes)
+    trm_hoy = obtener_trm_cached(dia_llegada)
+    trm_manana = obtener_trm_cached(dia_despues)
+
+    trms = {
+        dia_antes: trm_ayer,
+        dia_llegada: trm_hoy,
+        dia_despues: trm_manana
+    }
+
+    # Los valores editados en la barra lateral aplican a las fechas de hoy y mañana
+    hoy_col = datetime.now(TIMEZONE).date()
+    if trm_hoy_manual and hoy_col in trms:
+        trms[hoy_col] = trm_hoy_manual
+    if trm_manana_manual and hoy_col + timedelta(days=1) in trms:
+        trms[hoy_col + timedelta(days=1)] = trm_manana_manual
+
+    trms_validas = {k: v for k, v in trms.items() if v is not None and v > 0}
+    if not trms_validas:
+        return "Sin datos", 0.0, trms
+
+    mejor_fecha = max(trms_validas, key=trms_validas.get)
+    mejor_trm = trms_validas[mejor_fecha]
+    return mejor_fecha, mejor_trm, trms
+
+def serie_trm(inicio, fin, trm_hoy_manual=None, trm_manana_manual=None):
+    # TRM diaria del rango con la regla de obtener_trm_cached: valor publicado o el último conocido
+    precargar_trm_rango(inicio, fin)
+    dias = pd.date_range(inicio, fin, freq="D")
+    valores = get_trm_store().rango(inicio, fin)
+    serie = pd.Series({pd.Timestamp(f): v for f, v in valores.items()}, dtype="float64").reindex(dias)
+    if pd.isna(serie.iloc[0]):
+        serie.iloc[0] = last_known_trm(inicio) or float("nan")
+    serie = serie.ffill()
+
+    hoy_col = pd.Timestamp(datetime.now(TIMEZONE).date())
+    if trm_hoy_manual and hoy_col in serie.index:
+        serie[hoy_col] = trm_hoy_manual
+    if trm_manana_manual and hoy_col + pd.Timedelta(days=1) in serie.index:
+        serie[hoy_col + pd.Timedelta(days=1)] = trm_manana_manual
+    return serie
+
+# -------------------------------
+# Precarga de TRM en segundo plano
+# -------------------------------
+PREFETCH_DELAY = 60
+PREFETCH_RETRY = 300
+PREFETCH_MAX_INTENTOS = 24
+
+class TrmPrefetcher(threading.Thread):
+    # Trae y persiste la TRM de mañana apenas se publica (14:00 COL)
+    def __init__(self, store):
+        super().__init__(name="trm-prefetch", daemon=True)
+        self.store = store
+        self._stop_event = threading.Event()
+
+    def _traer(self, fecha):
+        if self.store.get(fecha) is not None:
+            return True
+        try:
+            trm = obtener_trm_oficial(fecha)
+        except Exception:
+            trm = None
+        if trm is not None and trm > 0:
+            self.store.upsert(fecha, trm)
+            return True
+        return False
+
+    def _traer_con_reintentos(self, fecha):
+        for _ in range(PREFETCH_MAX_INTENTOS):
+            if self._traer(fecha) or self._stop_event.is_set():
+                return
+            # Jitter para no sincronizar reintentos entre procesos
+            self._stop_event.wait(PREFETCH_RETRY * random.uniform(0.5, 1.5))
+
+    def run(self):
+        hoy_col = datetime.now(TIMEZONE).date()
+        self._traer(hoy_col)
+        self._traer(hoy_col + timedelta(days=1))
+        while not self._stop_event.is_set():
+            espera = seconds_until_next_trm(*TRM_PUBLICACION) + PREFETCH_DELAY
+            if self._stop_event.wait(espera):
+                return
+            self._traer_con_reintentos(datetime.now(TIMEZONE).date() + timedelta(days=1))
+
+    def stop(self):
+        self._stop_event.set()
+
+@config.recurso
+def iniciar_prefetch_trm():
+    prefetcher = TrmPrefetcher(get_trm_store())
+    prefetcher.start()
+    return prefetcher
+
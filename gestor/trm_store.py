@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+
+class TrmStore:
+    # Historial de TRM indexado por fecha (una fila por fecha) sobre SQLite
+    def __init__(self, path, csv_legacy=None):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS trm (fecha TEXT PRIMARY KEY, trm REAL NOT NULL) WITHOUT ROWID")
+        if csv_legacy:
+            self._migrar_csv(csv_legacy)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _key(fecha):
+        if isinstance(fecha, (date, datetime)):
+            return fecha.strftime("%Y-%m-%d")
+        return str(fecha)[:10]
+
+    def _migrar_csv(self, csv_path):
+        # Migración única desde el trm_history.csv de solo-anexar
+        if not os.path.exists(csv_path):
+            return
+        with self._lock, self._connect() as conn:
+            if conn.execute("SELECT 1 FROM trm LIMIT 1").fetchone():
+                return
+            try:
+                df = pd.read_csv(csv_path, encoding='utf-8')
+            except Exception:
+                return
+            df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce').dt.strftime("%Y-%m-%d")
+            df['trm'] = pd.to_numeric(df['trm'], errors='coerce')
+            df = df.dropna(subset=['fecha', 'trm']).drop_duplicates(subset='fecha', keep='last')
+            conn.executemany(
+                "INSERT OR REPLACE INTO trm (fecha, trm) VALUES (?, ?)",
+                list(zip(df['fecha'], df['trm'].astype(float)))
+            )
+
+    def upsert(self, fecha, trm):
+        self.upsert_many({fecha: trm})
+
+    def upsert_many(self, valores):
+        if not valores:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO trm (fecha, trm) VALUES (?, ?) "
+                "ON CONFLICT(fecha) DO UPDATE SET trm = excluded.trm",
+                [(self._key(f), float(v)) for f, v in valores.items()]
+            )
+
+    def get(self, fecha):
+        with self._connect() as conn:
+            row = conn.execute("SELECT trm FROM trm WHERE fecha = ?", (self._key(fecha),)).fetchone()
+        return row[0] if row else None
+
+    def on_or_before(self, fecha):
+        # Valor vigente en la fecha: la última TRM registrada en o antes de ella
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT trm FROM trm WHERE fecha <= ? ORDER BY fecha DESC LIMIT 1",
+                (self._key(fecha),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def rango(self, inicio, fin):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT fecha, trm FROM trm WHERE fecha BETWEEN ? AND ? ORDER BY fecha",
+                (self._key(inicio), self._key(fin))
+            ).fetchall()
+        return {datetime.strptime(f, "%Y-%m-%d").date(): v for f, v in rows}
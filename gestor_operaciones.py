@@ -3,28 +3,49 @@
 # -------------------------------
 
 import streamlit as st
-from streamlit.runtime.scriptrunner import RerunException, RerunData
+from streamlit.runtime.scriptrunner import RerunException, RerunData, add_script_run_ctx, get_script_run_ctx
 import pandas as pd
-import os
-from datetime import datetime, timedelta, time
-from babel.dates import format_date
-from scraper import obtener_trm_oficial
-import pytz
-import json
-import gspread
-from google.oauth2 import service_account
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
+import numpy as np
+from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+# La lógica vive en el paquete gestor (importable sin Streamlit); aquí solo queda la interfaz
+from gestor import config, datos, trazas
+from gestor.config import TIMEZONE
+from gestor.datos import (read_operaciones_df, read_calendario, upsert_operaciones, eliminar_operaciones,
+                          alertas_programadas, guardar_alertas_lote, read_alertas_historial,
+                          marcar_alertas_resueltas, claves_alertas, get_journal, get_replicador, iniciar_archivador,
+                          ESTADOS_REALIZADOS)
+from gestor.trm import (obtener_trm_cached, last_known_trm, seconds_until_next_trm, human_readable_countdown,
+                        sugerir_mejor_dia, iniciar_prefetch_trm)
+from gestor.alertas import generar_alertas, rango_filtro, formatear_fecha, formatear_fechas
+from gestor.importacion import importar_operaciones, COLUMNAS_REQUERIDAS
+from gestor.sheets import sheets_configurado
+from gestor.storage import MODALIDADES, TIPOS_OPERACION
 
 # -------------------------------
 # Configuración inicial
 # -------------------------------
 st.set_page_config(page_title="Gestor Operaciones CE", layout="centered")
-TIMEZONE = pytz.timezone("America/Bogota")
+# El paquete lee los mismos secrets que la app
+config.usar_secrets(st.secrets)
 
-# Archivos locales de respaldo
-ARCHIVO_CSV = "operaciones.csv"
-HISTORIAL_CSV = "alertas.csv"
-TRM_HISTORY = "trm_history.csv"
+# Copy-on-write solo en la app (el paquete gestor no cambia opciones globales de pandas):
+# la caché de lecturas sirve entonces copias superficiales que se separan al modificarse
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# Trazas por rerun en un JSONL rotativo; el panel de tiempos solo lo ven los usuarios en [trazas].admins
+try:
+    TRAZAS_CONFIG = dict(st.secrets.get("trazas", {}))
+except Exception:
+    TRAZAS_CONFIG = {}
+TRAZAS_ARCHIVO = TRAZAS_CONFIG.get("archivo", "trazas.jsonl")
+TRAZAS_MAX_BYTES = int(TRAZAS_CONFIG.get("max_mb", 5)) * 1024 * 1024
+TRAZAS_COPIAS = int(TRAZAS_CONFIG.get("copias", 3))
+TRAZAS_ADMINS = list(TRAZAS_CONFIG.get("admins", []))
+if TRAZAS_CONFIG.get("activo", True):
+    trazas.configurar(TRAZAS_ARCHIVO, TRAZAS_MAX_BYTES, TRAZAS_COPIAS)
 
 # -------------------------------
 # Autenticación
@@ -46,6 +67,7 @@ def login_ui():
             return
         if usuario == USER and contrasena == PASS:
             st.session_state["logged_in"] = True
+            st.session_state["usuario"] = usuario
             raise RerunException(RerunData())
         else:
             st.sidebar.error("Usuario o contraseña incorrectos")
@@ -54,347 +76,81 @@ if "logged_in" not in st.session_state or not st.session_state.get("logged_in",
     login_ui()
     st.stop()
 
-# -------------------------------
-# Helper functions para Google Sheets
-# -------------------------------
-def extract_sheet_id_from_url(url):
-    try:
-        parts = url.split("/d/")
-        if len(parts) > 1:
-            return parts[1].split("/")[0]
-    except Exception:
-        return None
-    return None
-
-def get_sheet_info_from_secrets():
-    creds_info = None
-    spreadsheet_identifier = None
-
-    try:
-        if "gcp" in st.secrets and "service_account" in st.secrets["gcp"]:
-            sa = st.secrets["gcp"]["service_account"]
-            creds_info = sa if isinstance(sa, dict) else json.loads(sa)
-            spreadsheet_identifier = st.secrets["gcp"].get("sheet_id") or st.secrets["gcp"].get("spreadsheet_url")
-    except Exception:
-        pass
-
-    if creds_info is None and "gcp_service_account" in st.secrets:
-        try:
-            sa = st.secrets["gcp_service_account"]
-            creds_info = sa if isinstance(sa, dict) else json.loads(sa)
-        except Exception:
-            pass
-
-    if spreadsheet_identifier is None:
-        try:
-            if "sheets" in st.secrets:
-                spreadsheet_identifier = st.secrets["sheets"].get("spreadsheet_url") or st.secrets["sheets"].get("sheet_id")
-        except Exception:
-            pass
-
-    return creds_info, spreadsheet_identifier
-
-def get_gs_client():
-    creds_info, _ = get_sheet_info_from_secrets()
-    if not creds_info:
-        return None
-    try:
-        scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        creds = service_account.Credentials.from_service_account_info(creds_info, scopes=scopes)
-        return gspread.authorize(creds)
-    except Exception as e:
-        st.error(f"Error al autenticar con Google: {str(e)}")
-        return None
-
-def open_spreadsheet():
-    gc = get_gs_client()
-    if not gc:
-        return None, None
-    
-    _, spreadsheet_identifier = get_sheet_info_from_secrets()
-    if not spreadsheet_identifier:
-        return None, None
-    
-    try:
-        if spreadsheet_identifier.startswith("http"):
-            sh = gc.open_by_url(spreadsheet_identifier)
-            return sh, spreadsheet_identifier
-        else:
-            sh = gc.open_by_key(spreadsheet_identifier)
-            return sh, spreadsheet_identifier
-    except Exception:
-        try:
-            sheet_id = extract_sheet_id_from_url(spreadsheet_identifier)
-            if sheet_id:
-                return gc.open_by_key(sheet_id), sheet_id
-        except Exception:
-            pass
-    return None, None
-
-# -------------------------------
-# Operaciones con Google Sheets
-# -------------------------------
-def ensure_worksheet(sheet, title, headers):
-    try:
-        ws = sheet.worksheet(title)
-    except Exception:
-        ws = sheet.add_worksheet(title=title, rows="1000", cols=str(len(headers)))
-        ws.append_row(headers)
-    return ws
-
-def read_sheet_dataframe(sheet_title="operaciones"):
-    sh, _ = open_spreadsheet()
-    base_columns = ['Consecutivo','Modalidad','Tipo','Cliente','FechaLlegada']
-    additional_columns = ['FechaCertificacionFletes', 'EstadoCertificacionFletes',
-                         'FechaSolicitarLiberacion', 'EstadoSolicitarLiberacion']
-    all_columns = base_columns + additional_columns
-    
-    if sh:
-        try:
-            ws = ensure_worksheet(sh, sheet_title, all_columns)
-            df = get_as_dataframe(ws, evaluate_formulas=True, usecols=None) or pd.DataFrame(columns=all_columns)
-            
-            # Conversión de tipos de datos
-            for col in base_columns[:4] + additional_columns[1::2]:
-                if col in df.columns:
-                    df[col] = df[col].astype(str)
-            
-            for col in ['FechaLlegada', 'FechaCertificacionFletes', 'FechaSolicitarLiberacion']:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-            
-            # Limpieza de datos
-            df = df.dropna(how="all")
-            if list(df.columns)[:len(base_columns)] != base_columns:
-                df.columns = [str(c) for c in df.columns]
-                if len(df.columns) >= len(all_columns):
-                    df = df.iloc[:, :len(all_columns)]
-                    df.columns = all_columns
-                else:
-                    for col in all_columns:
-                        if col not in df.columns:
-                            df[col] = ""
-                    df = df[all_columns]
-            
-            df = df.dropna(subset=['Consecutivo'], how='all').fillna("")
-            return df[all_columns]
-        except Exception as e:
-            st.error(f"Error al leer datos: {str(e)}")
-    
-    # Fallback a CSV local
-    if os.path.exists(ARCHIVO_CSV):
-        try:
-            return pd.read_csv(ARCHIVO_CSV, encoding='utf-8')
-        except Exception:
-            pass
-    return pd.DataFrame(columns=all_columns)
-
-def save_sheet_dataframe(df, sheet_title="operaciones"):
-    base_columns = ['Consecutivo','Modalidad','Tipo','Cliente','FechaLlegada']
-    additional_columns = ['FechaCertificacionFletes', 'EstadoCertificacionFletes',
-                         'FechaSolicitarLiberacion', 'EstadoSolicitarLiberacion']
-    all_columns = base_columns + additional_columns
-    
-    for col in all_columns:
-        if col not in df.columns:
-            df[col] = ""
-    
-    df_to_save = df[all_columns].copy()
-    sh, _ = open_spreadsheet()
-    
-    if sh:
-        try:
-            ws = ensure_worksheet(sh, sheet_title, all_columns)
-            set_with_dataframe(ws, df_to_save, include_index=False, include_column_header=True, resize=True)
-        except Exception as e:
-            st.error(f"Error al guardar datos: {str(e)}")
-    
-    # Backup local
-    df_to_save.to_csv(ARCHIVO_CSV, index=False, encoding='utf-8')
-
-# -------------------------------
-# Funciones principales
-# -------------------------------
-def read_operaciones_df():
-    return read_sheet_dataframe("operaciones")
-
-def save_operaciones_df(df):
-    save_sheet_dataframe(df, "operaciones")
-
-# -------------------------------
-# Manejo de Alertas
-# -------------------------------
-def read_alertas_sheet():
-    sh, _ = open_spreadsheet()
-    expected_columns = ["FechaRegistro","Consecutivo","Cliente","Tipo","FechaSuceso","Resuelta"]
-    
-    if sh:
-        try:
-            ws = ensure_worksheet(sh, "alertas", expected_columns)
-            df = get_as_dataframe(ws, evaluate_formulas=True) or pd.DataFrame(columns=expected_columns)
-            df = df.dropna(how="all")
-            
-            for col in expected_columns:
-                if col not in df.columns:
-                    df[col] = ""
-            
-            try:
-                df['FechaSuceso'] = pd.to_datetime(df['FechaSuceso']).dt.date
-            except Exception:
-                pass
-            
-            return df[expected_columns]
-        except Exception:
-            pass
-    
-    if os.path.exists(HISTORIAL_CSV):
-        try:
-            df = pd.read_csv(HISTORIAL_CSV, encoding='utf-8')
-            df['FechaSuceso'] = pd.to_datetime(df['FechaSuceso']).dt.date
-            return df
-        except Exception:
-            pass
-    return pd.DataFrame(columns=expected_columns)
-
-def guardar_alerta_historial(consecutivo, cliente, tipo, fecha_suceso):
-    row = {
-        "FechaRegistro": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "Consecutivo": consecutivo,
-        "Cliente": cliente,
-        "Tipo": tipo,
-        "FechaSuceso": fecha_suceso.strftime("%Y-%m-%d") if isinstance(fecha_suceso, (datetime.date, datetime.datetime)) else str(fecha_suceso),
-        "Resuelta": False
-    }
-    
-    sh, _ = open_spreadsheet()
-    if sh:
-        try:
-            ws = ensure_worksheet(sh, "alertas", list(row.keys()))
-            ws.append_row([row[k] for k in ["FechaRegistro","Consecutivo","Cliente","Tipo","FechaSuceso","Resuelta"]])
-            return
-        except Exception:
-            pass
-    
-    # Fallback local
-    df_hist = read_alertas_sheet()
-    df_hist = pd.concat([df_hist, pd.DataFrame([row])], ignore_index=True)
-    df_hist.to_csv(HISTORIAL_CSV, index=False, encoding='utf-8')
-
-def guardar_alerta(consecutivo, cliente, mensaje):
-    guardar_alerta_historial(consecutivo, cliente, mensaje, datetime.now())
-
-def read_alertas_historial():
-    return read_alertas_sheet()
-
-def marcar_alerta_resuelta(idx):
-    df = read_alertas_historial()
-    if 0 <= idx < len(df):
-        df.loc[idx, 'Resuelta'] = True
-        sh, _ = open_spreadsheet()
-        if sh:
-            try:
-                ws = ensure_worksheet(sh, "alertas", df.columns.tolist())
-                set_with_dataframe(ws, df, include_index=False, include_column_header=True, resize=True)
-                return
-            except Exception:
-                pass
-        df.to_csv(HISTORIAL_CSV, index=False, encoding='utf-8')
+# Traza de este rerun; la anterior se conserva para el panel de tiempos
+st.session_state["traza_anterior"] = st.session_state.get("traza")
+st.session_state["traza"] = trazas.iniciar("rerun", previa=st.session_state["traza_anterior"])
+trazas.fase("arranque")
 
 # -------------------------------
-# Manejo de TRM
+# Funciones de utilidad
 # -------------------------------
-_trm_cache = {}
-
-def save_trm_history(fecha, trm_val):
-    row = {"fecha": fecha.strftime("%Y-%m-%d"), "trm": trm_val}
-    if os.path.exists(TRM_HISTORY):
-        df = pd.read_csv(TRM_HISTORY, encoding='utf-8')
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    else:
-        df = pd.DataFrame([row])
-    df.to_csv(TRM_HISTORY, index=False, encoding='utf-8')
-
-def last_known_trm():
-    if os.path.exists(TRM_HISTORY):
-        df = pd.read_csv(TRM_HISTORY, encoding='utf-8')
-        if not df.empty:
-            return float(df.iloc[-1]['trm'])
-    return None
-
-def obtener_trm_cached(fecha):
-    key = fecha.strftime("%Y-%m-%d")
-    if key in _trm_cache:
-        return _trm_cache[key]
-    
-    try:
-        trm = obtener_trm_oficial(fecha)
-        if trm is not None and trm > 0:
-            _trm_cache[key] = trm
-            save_trm_history(fecha, trm)
-            return trm
-    except Exception:
-        pass
-    
-    last = last_known_trm()
-    if last is not None:
-        _trm_cache[key] = last
-        return last
-    
-    return 0.0
+def estado_accion(fecha_programada, fecha_real, estado_real, hoy):
+    estado = estado_real.astype("string").fillna("").str.strip().str.lower()
+    hay_real = fecha_real.notna()
+    hay_programada = fecha_programada.notna()
+    condiciones = [
+        hay_real & estado.isin(ESTADOS_REALIZADOS),
+        hay_real,
+        hay_programada & (fecha_programada < pd.Timestamp(hoy)),
+        hay_programada,
+    ]
+    etiquetas = ["✅ Realizado", "⏳ Pendiente", "⚠️ Atrasado", "📅 Programado"]
+    etiqueta = np.select(condiciones, etiquetas, default="")
+    fecha_str = formatear_fechas(fecha_real.where(hay_real, fecha_programada), "d MMM").to_numpy(dtype=object)
+    texto = np.where(etiqueta != "", etiqueta.astype(object) + " (" + fecha_str + ")", "Sin programar")
+    return pd.Series(texto, index=estado_real.index)
 
 # -------------------------------
-# Funciones de utilidad
+# Arranque concurrente
 # -------------------------------
-def seconds_until_next_trm(target_hour=14, target_minute=0):
-    now = datetime.now(TIMEZONE)
-    today_target = TIMEZONE.localize(datetime.combine(now.date(), time(hour=target_hour, minute=target_minute)))
-    
-    if now >= today_target:
-        tomorrow = now.date() + timedelta(days=1)
-        next_target = TIMEZONE.localize(datetime.combine(tomorrow, time(hour=target_hour, minute=target_minute)))
-    else:
-        next_target = today_target
-    
-    return int((next_target - now).total_seconds())
-
-def human_readable_countdown(sec):
-    if sec <= 0:
-        return "0s"
-    m, s = divmod(sec, 60)
-    h, m = divmod(m, 60)
-    parts = []
-    if h: parts.append(f"{h}h")
-    if m: parts.append(f"{m}m")
-    parts.append(f"{s}s")
-    return " ".join(parts)
-
-def sugerir_mejor_dia(fecha_llegada, trm_hoy_manual=None, trm_manana_manual=None):
-    dia_antes = fecha_llegada - timedelta(days=1)
-    dia_llegada = fecha_llegada
-    dia_despues = fecha_llegada + timedelta(days=1)
-
-    trm_ayer = obtener_trm_cached(dia_antes)
-    trm_hoy = obtener_trm_cached(dia_llegada)
-    trm_manana = obtener_trm_cached(dia_despues)
-
-    if trm_hoy_manual:
-        trm_hoy = trm_hoy_manual
-    if trm_manana_manual:
-        trm_manana = trm_manana_manual
-
-    trms = {
-        dia_antes: trm_ayer,
-        dia_llegada: trm_hoy,
-        dia_despues: trm_manana
-    }
-
-    trms_validas = {k: v for k, v in trms.items() if v is not None and v > 0}
-    if not trms_validas:
-        return "Sin datos", 0.0, trms
-
-    mejor_fecha = max(trms_validas, key=trms_validas.get)
-    mejor_trm = trms_validas[mejor_fecha]
-    return mejor_fecha, mejor_trm, trms
+# Segundos que el sidebar espera la TRM antes de mostrar el último valor conocido
+ARRANQUE_ESPERA_TRM = 0.3
+
+def en_paralelo(ejecutor, funcion, *args, **kwargs):
+    # Con el contexto del rerun, para que secrets y recursos cacheados funcionen en el hilo,
+    # y con su traza, para que el panel de tiempos cuente también lo que se hizo en el hilo
+    ctx = get_script_run_ctx()
+    traza = trazas.actual()
+    def tarea():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        with trazas.en_hilo(traza, funcion.__name__):
+            return funcion(*args, **kwargs)
+    return ejecutor.submit(tarea)
+
+def trm_sidebar(hoy, manana):
+    # El prefetcher mantiene hoy/mañana al día; aquí solo se lee lo persistido
+    iniciar_prefetch_trm()
+    trm_hoy = obtener_trm_cached(hoy, consultar_red=False)
+    trm_manana = obtener_trm_cached(manana, consultar_red=False)
+    # Fallback si no hay TRM disponible
+    if trm_hoy == 0.0:
+        trm_hoy = last_known_trm() or 0.0
+    if trm_manana == 0.0:
+        trm_manana = last_known_trm() or trm_hoy or 0.0
+    return trm_hoy, trm_manana
+
+def iniciar_servicios():
+    # Almacén (con su posible hidratación desde Sheets), archivador y replicador
+    iniciar_archivador()
+    if sheets_configurado():
+        get_replicador()
+
+@st.cache_resource
+def arrancar_servicios():
+    # Una vez por proceso y en su propio hilo: ninguna sesión hace cola detrás de otra para esperarlo
+    ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="servicios")
+    futuro = en_paralelo(ejecutor, iniciar_servicios)
+    ejecutor.shutdown(wait=False)
+    return futuro
+
+def precargar_pagina(opcion, hoy, estado):
+    # Deja en la caché de lecturas lo que la página va a pedir, según los widgets del rerun anterior
+    if opcion == "Ver Operaciones":
+        read_operaciones_df(desde=hoy - timedelta(days=30))
+    elif opcion == "Alertas":
+        inicio, fin = rango_filtro(estado.get("filtro_alertas", "Hoy"), hoy)
+        read_calendario(inicio - timedelta(days=1) if inicio else None, fin + timedelta(days=1) if fin else None)
+        read_alertas_historial(estado.get("incluir_archivadas", False), inicio, fin)
 
 # -------------------------------
 # Interfaz de usuario
@@ -402,42 +158,109 @@ def sugerir_mejor_dia(fecha_llegada, trm_hoy_manual=None, trm_manana_manual=None
 hoy = datetime.now(TIMEZONE).date()
 manana = hoy + timedelta(days=1)
 
-trm_hoy = obtener_trm_cached(hoy)
-trm_manana = obtener_trm_cached(manana)
+# TRM del sidebar, servicios y datos de la página se leen a la vez: el primer render
+# espera lo que tarde la lectura más lenta, no la suma de todas
+trazas.fase("arranque_concurrente")
+futuro_servicios = arrancar_servicios()
+# Hilos propios de este rerun: las lecturas de una sesión no esperan turno detrás de las de otra
+ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="arranque")
+futuro_trm = en_paralelo(ejecutor, trm_sidebar, hoy, manana)
+futuro_pagina = en_paralelo(
+    ejecutor, precargar_pagina, st.session_state.get("menu"), hoy,
+    {k: st.session_state.get(k) for k in ("filtro_alertas", "incluir_archivadas") if k in st.session_state}
+)
+ejecutor.shutdown(wait=False)
+
+def trm_o_ultima(futuro, timeout=None):
+    # TRM del hilo o, si falla, la última mostrada en la sesión (el error queda en la traza)
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturoTimeout:
+        raise
+    except Exception as e:
+        trazas.error("trm_sidebar", e)
+        return st.session_state.get("trm_sidebar", (0.0, 0.0))
 
-# Fallback si no hay TRM disponible
-if trm_hoy == 0.0:
-    trm_hoy = last_known_trm() or 0.0
-if trm_manana == 0.0:
-    trm_manana = last_known_trm() or trm_hoy or 0.0
+# Mientras la TRM no llega se muestra la última de la sesión y se completa al final del rerun
+trazas.fase("sidebar")
+try:
+    trm_hoy, trm_manana = trm_o_ultima(futuro_trm, ARRANQUE_ESPERA_TRM)
+    trm_pendiente = False
+except FuturoTimeout:
+    trm_hoy, trm_manana = st.session_state.get("trm_sidebar", (0.0, 0.0))
+    trm_pendiente = True
+
+# Copia inicial desde Sheets fallida: el almacén arrancó vacío
+if futuro_servicios.done() and datos.error_hidratacion:
+    st.sidebar.warning(f"No se pudieron copiar los datos de Google Sheets: {datos.error_hidratacion}")
+
+# Replicación en segundo plano de los cambios locales a Sheets
+if sheets_configurado() and futuro_servicios.done():
+    replicador = get_replicador()
+    pendientes = get_journal().backlog()
+    if pendientes:
+        st.sidebar.caption(f"🔄 Cambios pendientes de sincronizar con Sheets: {pendientes}")
+        if replicador.ultimo_error:
+            st.sidebar.caption(f"⚠️ Último error de sincronización: {replicador.ultimo_error}")
 
 # Sidebar TRM
 st.sidebar.title("📈 TRM Oficial (actualizable)")
-st.sidebar.write(f"🔍 TRM Hoy: ${trm_hoy:,.2f}")
-st.sidebar.write(f"🔍 TRM Mañana: ${trm_manana:,.2f}")
+trm_hoy_texto = st.sidebar.empty()
+trm_manana_texto = st.sidebar.empty()
+
+def mostrar_trm_sidebar(trm_hoy, trm_manana, pendiente=False):
+    sufijo = " (actualizando…)" if pendiente else ""
+    trm_hoy_texto.write(f"🔍 TRM Hoy: ${trm_hoy:,.2f}{sufijo}")
+    trm_manana_texto.write(f"🔍 TRM Mañana: ${trm_manana:,.2f}{sufijo}")
+
+mostrar_trm_sidebar(trm_hoy, trm_manana, trm_pendiente)
+if not trm_pendiente:
+    st.session_state["trm_sidebar"] = (trm_hoy, trm_manana)
 
 segundos_rest = seconds_until_next_trm(14, 0)
 st.sidebar.write(f"⏳ Tiempo hasta próxima TRM (14:00 COL): {human_readable_countdown(segundos_rest)}")
 
-# Inputs manuales TRM
-trm_hoy_input = st.sidebar.number_input("TRM Hoy (editar)", value=float(trm_hoy), step=1.0)
-trm_manana_input = st.sidebar.number_input("TRM Mañana (editar)", value=float(trm_manana), step=1.0)
+# Inputs manuales TRM: conservan lo que escriba el usuario; mientras sigan en el último valor
+# sembrado, siguen a la TRM oficial (también cuando llega después de un valor provisional)
+def sembrar_trm(clave, valor, pendiente):
+    semilla = f"{clave}_semilla"
+    if clave not in st.session_state or (not pendiente and st.session_state[clave] == st.session_state.get(semilla)):
+        st.session_state[clave] = float(valor)
+        st.session_state[semilla] = float(valor)
+
+sembrar_trm("trm_hoy_input", trm_hoy, trm_pendiente)
+sembrar_trm("trm_manana_input", trm_manana, trm_pendiente)
+trm_hoy_input = st.sidebar.number_input("TRM Hoy (editar)", step=1.0, key="trm_hoy_input")
+trm_manana_input = st.sidebar.number_input("TRM Mañana (editar)", step=1.0, key="trm_manana_input")
 
 # Menú principal
-menu = ["Registrar Operación", "Ver Operaciones", "Alertas"]
-opcion = st.sidebar.radio("Selecciona:", menu)
+menu = ["Registrar Operación", "Importar Operaciones", "Ver Operaciones", "Alertas"]
+opcion = st.sidebar.radio("Selecciona:", menu, key="menu")
+trazas.fase(f"pagina:{opcion}")
+# La página usa el almacén: se espera a que arranque (normalmente ya lo hizo en un rerun anterior)
+try:
+    futuro_servicios.result()
+except Exception as e:
+    # Se reintenta en el siguiente rerun; la página abre el almacén por su cuenta
+    arrancar_servicios.clear()
+    st.sidebar.warning(f"No se pudieron iniciar los servicios: {e}")
+# La precarga solo calienta la caché: si falla, la página lee por su cuenta (el error queda en la traza)
+try:
+    with trazas.tramo("espera_precarga"):
+        futuro_pagina.result()
+except Exception:
+    pass
 
 # -------------------------------
 # Registrar Operación
 # -------------------------------
 if opcion == "Registrar Operación":
     st.header("Registrar Nueva Operación")
-    st.write(f"📅 Hoy es: {format_date(datetime.now(TIMEZONE).date(), format='full', locale='es')}")
-    df_ops = read_operaciones_df()
+    st.write(f"📅 Hoy es: {formatear_fecha(datetime.now(TIMEZONE).date(), 'full')}")
 
     consecutivo = st.text_input("Consecutivo (ej. DO AT25621)")
-    modalidad = st.selectbox("Modalidad", ["Marítimo", "Aéreo", "Terrestre", "Ferroviario"])
-    tipo = st.selectbox("Tipo", ["Importación", "Exportación"])
+    modalidad = st.selectbox("Modalidad", MODALIDADES)
+    tipo = st.selectbox("Tipo", TIPOS_OPERACION)
     cliente = st.text_input("Cliente")
     fecha_llegada = st.date_input("Fecha de Arribo (ETA)", datetime.now(TIMEZONE).date())
 
@@ -447,7 +270,6 @@ if opcion == "Registrar Operación":
             if not consecutivo:
                 st.error("El campo Consecutivo es obligatorio.")
             else:
-                df_ops = read_operaciones_df()
                 nueva_operacion = {
                     'Consecutivo': consecutivo,
                     'Modalidad': modalidad,
@@ -460,31 +282,19 @@ if opcion == "Registrar Operación":
                     'EstadoSolicitarLiberacion': ""
                 }
 
-                if consecutivo in df_ops['Consecutivo'].values:
-                    df_ops.loc[df_ops['Consecutivo'] == consecutivo, list(nueva_operacion.keys())] = list(nueva_operacion.values())
-                    mensaje = "✅ Operación actualizada correctamente."
+                resultado = upsert_operaciones(pd.DataFrame([nueva_operacion]))
+                if resultado['insertados']:
+                    st.success("✅ Operación creada correctamente.")
                 else:
-                    df_ops = pd.concat([df_ops, pd.DataFrame([nueva_operacion])], ignore_index=True)
-                    mensaje = "✅ Operación creada correctamente."
-
-                save_operaciones_df(df_ops)
-                st.success(mensaje)
+                    st.success("✅ Operación actualizada correctamente.")
 
                 # Generar alertas
-                guardar_alerta(consecutivo, cliente, f"Registro de operación para llegada {fecha_llegada.strftime('%Y-%m-%d')}")
-                
-                cert_fletes = fecha_llegada - timedelta(days=7)
-                if cert_fletes <= fecha_llegada:
-                    guardar_alerta(consecutivo, cliente, "Programada: Certificación de Fletes")
-                
-                liberacion = fecha_llegada - timedelta(days=2)
-                if liberacion <= fecha_llegada:
-                    guardar_alerta(consecutivo, cliente, "Programada: Solicitar Liberación")
+                guardar_alertas_lote(alertas_programadas(consecutivo, cliente, fecha_llegada))
                 
                 # Sugerencia TRM
                 mejor_fecha, mejor_trm, _ = sugerir_mejor_dia(fecha_llegada, trm_hoy_input, trm_manana_input)
                 if mejor_fecha != "Sin datos":
-                    sd = format_date(mejor_fecha, format="EEEE d 'de' MMMM 'de' yyyy", locale='es')
+                    sd = formatear_fecha(mejor_fecha, "EEEE d 'de' MMMM 'de' yyyy")
                     st.info(f"📌 Sugerencia: mejor día para facturar -> {sd} (TRM aprox: ${mejor_trm:,.2f})")
                 
                 st.rerun()
@@ -493,83 +303,63 @@ if opcion == "Registrar Operación":
         st.write("Ayuda rápida:")
         st.write("- Guarda operaciones y crea alertas programadas.")
         st.write("- Para modificar una operación puedes usar la pestaña 'Ver Operaciones'.")
+        st.write("- Para cargar muchas a la vez usa 'Importar Operaciones'.")
+
+# -------------------------------
+# Importar Operaciones
+# -------------------------------
+elif opcion == "Importar Operaciones":
+    st.header("📥 Importar Operaciones")
+    st.write(f"Archivo CSV o Excel (.xlsx) con las columnas {', '.join(COLUMNAS_REQUERIDAS)}. "
+             f"Modalidad: {', '.join(MODALIDADES)}. Tipo: {', '.join(TIPOS_OPERACION)}. "
+             "Fechas como AAAA-MM-DD o DD/MM/AAAA; las demás columnas del registro son opcionales.")
+    archivo = st.file_uploader("Archivo de operaciones", type=["csv", "xlsx"])
+    actualizar = st.checkbox("Actualizar las operaciones que ya existen", key="importar_actualizar")
+
+    if st.button("📥 Importar") and archivo is not None:
+        try:
+            resultado = importar_operaciones(archivo, archivo.name, actualizar)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success(
+                f"✅ {resultado['filas']} fila(s) leída(s): {len(resultado['insertados'])} operación(es) creada(s), "
+                f"{len(resultado['actualizados'])} actualizada(s), {len(resultado['sin_cambios'])} sin cambios."
+            )
+            if resultado['omitidos']:
+                st.info(f"{len(resultado['omitidos'])} operación(es) ya existían y no se modificaron: "
+                        f"{', '.join(resultado['omitidos'][:20])}{'…' if len(resultado['omitidos']) > 20 else ''}")
+            if resultado['duplicados']:
+                st.info(f"{len(resultado['duplicados'])} fila(s) con un Consecutivo repetido en el archivo: "
+                        "se importó la última fila de cada uno.")
+                st.dataframe(pd.DataFrame(resultado['duplicados']), hide_index=True)
+            if resultado['errores']:
+                errores = pd.DataFrame(resultado['errores'])
+                st.warning(f"⚠️ {len(errores)} fila(s) con errores no se importaron.")
+                st.dataframe(errores, hide_index=True)
+                st.download_button("Descargar reporte de errores", errores.to_csv(index=False).encode("utf-8-sig"),
+                                   file_name="errores_importacion.csv", mime="text/csv")
 
 # -------------------------------
 # Ver Operaciones
 # -------------------------------
 elif opcion == "Ver Operaciones":
     st.header("📋 Operaciones Registradas")
-    df_ops = read_operaciones_df()
-    
-    # Asegurar columnas necesarias
-    expected_columns = ['Consecutivo', 'Modalidad', 'Tipo', 'Cliente', 'FechaLlegada',
-                       'FechaCertificacionFletes', 'EstadoCertificacionFletes',
-                       'FechaSolicitarLiberacion', 'EstadoSolicitarLiberacion']
-    
-    for col in expected_columns:
-        if col not in df_ops.columns:
-            df_ops[col] = ""
-    
-    # Convertir fechas
-    df_ops['FechaLlegada_date'] = pd.to_datetime(df_ops['FechaLlegada'], errors='coerce').dt.date
-    df_ops['FechaCertificacionFletes'] = pd.to_datetime(df_ops['FechaCertificacionFletes'], errors='coerce').dt.date
-    df_ops['FechaSolicitarLiberacion'] = pd.to_datetime(df_ops['FechaSolicitarLiberacion'], errors='coerce').dt.date
+    # Solo operaciones recientes, filtradas en el almacén; las fechas llegan como datetime64
+    df_visible = read_operaciones_df(desde=hoy - timedelta(days=30))
+    llegada = df_visible['FechaLlegada'].dt.normalize()
     
-    # Calcular fechas programadas
-    df_ops['CertFletes_Programada'] = df_ops['FechaLlegada_date'] - pd.Timedelta(days=7)
-    df_ops['Liberacion_Programada'] = df_ops['FechaLlegada_date'] - pd.Timedelta(days=2)
-    
-    # Filtrar operaciones recientes
-    fecha_min = hoy - timedelta(days=30)
-    df_visible = df_ops[df_ops['FechaLlegada_date'] >= fecha_min].copy()
-    
-    # Función para mostrar estado
-    def formato_accion(fecha_programada, fecha_real, estado_real):
-        try:
-            estado = str(estado_real).strip().lower() if pd.notna(estado_real) else ""
-            
-            if pd.notna(fecha_real):
-                fecha_str = format_date(fecha_real, format="d MMM", locale='es')
-                if estado in ["lista", "completado", "hecho", "realizado"]:
-                    return f"✅ Realizado ({fecha_str})"
-                return f"⏳ Pendiente ({fecha_str})"
-            
-            if pd.notna(fecha_programada):
-                fecha_str = format_date(fecha_programada, format="d MMM", locale='es')
-                if fecha_programada < datetime.now().date():
-                    return f"⚠️ Atrasado ({fecha_str})"
-                return f"📅 Programado ({fecha_str})"
-            
-            return "Sin programar"
-        except Exception:
-            return "Sin datos"
-    
-    # Aplicar formato
-    df_visible['Certificación Fletes'] = df_visible.apply(
-        lambda row: formato_accion(
-            row['CertFletes_Programada'],
-            row['FechaCertificacionFletes'],
-            row['EstadoCertificacionFletes']
-        ), axis=1
+    # Estado de las acciones (fechas programadas: 7 y 2 días antes del ETA)
+    df_visible['Certificación Fletes'] = estado_accion(
+        llegada - pd.Timedelta(days=7), df_visible['FechaCertificacionFletes'], df_visible['EstadoCertificacionFletes'], hoy
     )
-    
-    df_visible['Solicitar Liberación'] = df_visible.apply(
-        lambda row: formato_accion(
-            row['Liberacion_Programada'],
-            row['FechaSolicitarLiberacion'],
-            row['EstadoSolicitarLiberacion']
-        ), axis=1
+    df_visible['Solicitar Liberación'] = estado_accion(
+        llegada - pd.Timedelta(days=2), df_visible['FechaSolicitarLiberacion'], df_visible['EstadoSolicitarLiberacion'], hoy
     )
     
     # Columnas adicionales
-    df_visible['Arribo (ETA)'] = df_visible['FechaLlegada_date'].apply(
-        lambda d: format_date(d, format="EEE d MMM yyyy", locale='es') if pd.notna(d) else "Sin fecha"
-    )
-    
-    hoy_dt = pd.to_datetime(hoy)
-    df_visible['Días ETA'] = df_visible['FechaLlegada_date'].apply(
-        lambda d: (pd.to_datetime(d) - hoy_dt).days if pd.notna(d) else "Sin fecha"
-    )
+    df_visible['Arribo (ETA)'] = formatear_fechas(llegada, "EEE d MMM yyyy", vacio="Sin fecha")
+    df_visible['Días ETA'] = (llegada - pd.Timestamp(hoy)).dt.days
     
     # Columnas para mostrar
     columnas_mostrar = ['Consecutivo', 'Modalidad', 'Tipo', 'Cliente', 'Arribo (ETA)',
@@ -577,8 +367,9 @@ elif opcion == "Ver Operaciones":
     
     # Editor de datos
     st.subheader("Editar operaciones")
+    # Texto libre en el editor (una columna categórica se mostraría como lista cerrada)
     df_edit = st.data_editor(
-        df_visible[columnas_mostrar],
+        df_visible[columnas_mostrar].astype({'Modalidad': "string", 'Tipo': "string", 'Cliente': "string"}),
         num_rows="dynamic",
         disabled=['Certificación Fletes', 'Solicitar Liberación', 'Arribo (ETA)', 'Días ETA'],
         column_config={
@@ -602,15 +393,9 @@ elif opcion == "Ver Operaciones":
     col1, col2 = st.columns(2)
     with col1:
         if st.button("💾 Guardar cambios"):
-            df_current = read_operaciones_df()
-            for _, row in df_edit.iterrows():
-                cons = row['Consecutivo']
-                if cons in df_current['Consecutivo'].values:
-                    df_current.loc[df_current['Consecutivo'] == cons, ['Modalidad', 'Tipo', 'Cliente']] = [
-                        row['Modalidad'], row['Tipo'], row['Cliente']
-                    ]
-            save_operaciones_df(df_current)
-            st.success("✅ Cambios guardados.")
+            # Solo se actualizan operaciones existentes, todas en un lote
+            resultado = upsert_operaciones(df_edit[['Consecutivo', 'Modalidad', 'Tipo', 'Cliente']], insertar=False)
+            st.success(f"✅ Cambios guardados ({len(resultado['actualizados'])} operación(es) actualizada(s)).")
             st.rerun()
 
     with col2:
@@ -619,9 +404,7 @@ elif opcion == "Ver Operaciones":
             options=df_visible['Consecutivo'].unique()
         )
         if st.button("🗑️ Eliminar seleccionadas") and eliminar:
-            df_current = read_operaciones_df()
-            df_current = df_current[~df_current['Consecutivo'].isin(eliminar)]
-            save_operaciones_df(df_current)
+            eliminar_operaciones(eliminar)
             st.success(f"✅ {len(eliminar)} operación(es) eliminada(s).")
             st.rerun()
 
@@ -633,62 +416,42 @@ elif opcion == "Ver Operaciones":
         use_container_width=True
     )
 
+    # Consulta histórica: incluye las operaciones ya archivadas
+    with st.expander("🗄️ Consultar historial (incluye archivadas)"):
+        col_desde, col_hasta = st.columns(2)
+        hist_desde = col_desde.date_input("Desde", hoy - timedelta(days=365), key="hist_desde")
+        hist_hasta = col_hasta.date_input("Hasta", hoy, key="hist_hasta")
+        df_hist_ops = read_operaciones_df(desde=hist_desde, hasta=hist_hasta, incluir_archivo=True)
+        df_hist_ops['Arribo (ETA)'] = formatear_fechas(df_hist_ops['FechaLlegada'], "EEE d MMM yyyy", vacio="Sin fecha")
+        st.dataframe(
+            df_hist_ops[['Consecutivo', 'Modalidad', 'Tipo', 'Cliente', 'Arribo (ETA)',
+                         'EstadoCertificacionFletes', 'EstadoSolicitarLiberacion']],
+            hide_index=True,
+            use_container_width=True
+        )
+
 # -------------------------------
 # Alertas
 # -------------------------------
 elif opcion == "Alertas":
     st.header("🔔 Alertas y Tareas")
-    df_ops = read_operaciones_df()
     hoy = datetime.now(TIMEZONE).date()
+    filtro = st.selectbox("Filtrar alertas por:", ["Hoy","Esta semana","Próximo mes","Todas"], key="filtro_alertas")
 
-    alertas = []
-    for _, fila in df_ops.iterrows():
-        try:
-            llegada = pd.to_datetime(fila['FechaLlegada']).date()
-            if pd.isna(llegada):
-                continue
-                
-            cert_fletes = llegada - timedelta(days=7)
-            liberacion = llegada - timedelta(days=2)
-            mejor_fecha, _, _ = sugerir_mejor_dia(llegada, trm_hoy_input, trm_manana_input)
-
-            if llegada == hoy:
-                alertas.append({'Tipo':'🚢 Llegada de Carga','Consecutivo':fila['Consecutivo'],'Cliente':fila['Cliente'],'Fecha':llegada,'ETA':llegada})
-            if cert_fletes == hoy:
-                alertas.append({'Tipo':'📄 Certificación de Fletes','Consecutivo':fila['Consecutivo'],'Cliente':fila['Cliente'],'Fecha':cert_fletes,'ETA':llegada})
-            if liberacion == hoy:
-                alertas.append({'Tipo':'📦 Solicitar Liberación','Consecutivo':fila['Consecutivo'],'Cliente':fila['Cliente'],'Fecha':liberacion,'ETA':llegada})
-            if mejor_fecha != "Sin datos" and mejor_fecha == hoy:
-                alertas.append({'Tipo':'💰 Fecha Facturación','Consecutivo':fila['Consecutivo'],'Cliente':fila['Cliente'],'Fecha':mejor_fecha,'ETA':llegada})
-        except Exception:
-            continue
-
-    df_hist = read_alertas_historial()
-
-    filtro = st.selectbox("Filtrar alertas por:", ["Hoy","Esta semana","Próximo mes","Todas"])
-    def in_range(fecha, opcion):
-        if opcion == "Hoy":
-            return fecha == hoy
-        if opcion == "Esta semana":
-            inicio = hoy - timedelta(days=hoy.weekday())
-            fin = inicio + timedelta(days=6)
-            return inicio <= fecha <= fin
-        if opcion == "Próximo mes":
-            fin = hoy + timedelta(days=30)
-            return hoy <= fecha <= fin
-        return True
-
-    alertas_filtradas = [a for a in alertas if in_range(a['Fecha'], filtro)]
+    # Los filtros son búsquedas por rango en el calendario de alertas y en el historial
+    inicio, fin = rango_filtro(filtro, hoy)
+    alertas_filtradas = generar_alertas(inicio, fin, trm_hoy_input, trm_manana_input)
+    trazas.fase("render:alertas")
     st.subheader("Alertas generadas desde operaciones")
-    if alertas_filtradas:
-        for a in sorted(alertas_filtradas, key=lambda x: x['Fecha']):
-            fecha_str = format_date(a['Fecha'], format="full", locale='es')
-            eta_str = format_date(a['ETA'], format="EEEE, d 'de' MMMM 'de' yyyy", locale='es')
+    if not alertas_filtradas.empty:
+        for a in alertas_filtradas.itertuples(index=False):
+            fecha_str = formatear_fecha(a.Fecha.date(), "full")
+            eta_str = formatear_fecha(a.ETA.date(), "EEEE, d 'de' MMMM 'de' yyyy")
             st.markdown(f"""
             <div style="border:2px solid #007BFF; border-radius:10px; padding:10px; margin-bottom:8px;">
-                <strong>{a['Tipo']}</strong><br>
-                Consecutivo: {a['Consecutivo']}<br>
-                Cliente: {a['Cliente']}<br>
+                <strong>{a.Tipo}</strong><br>
+                Consecutivo: {a.Consecutivo}<br>
+                Cliente: {a.Cliente}<br>
                 Fecha del suceso: {fecha_str}<br>
                 Fecha de Arribo (ETA): {eta_str}
             </div>
@@ -696,18 +459,51 @@ elif opcion == "Alertas":
     else:
         st.info("No hay alertas generadas por operaciones en este periodo.")
 
+    trazas.fase("historial_alertas")
     st.subheader("Historial de alertas (registro)")
-    df_hist = read_alertas_historial()
-    if not df_hist.empty:
-        df_hist['FechaSuceso_date'] = pd.to_datetime(df_hist['FechaSuceso']).dt.date
-        df_hist_vis = df_hist[df_hist['FechaSuceso_date'].apply(lambda d: in_range(d, filtro))]
+    incluir_archivadas = st.checkbox("Incluir alertas archivadas", key="incluir_archivadas")
+    df_hist_vis = read_alertas_historial(incluir_archivadas, inicio, fin)
+    if not df_hist_vis.empty:
         st.dataframe(df_hist_vis[['FechaRegistro','Consecutivo','Cliente','Tipo','FechaSuceso','Resuelta']])
 
-        idx_to_mark = st.number_input("Índice de alerta para marcar resuelta", min_value=0, max_value=len(df_hist_vis)-1 if len(df_hist_vis)>0 else 0, step=1)
-        if st.button("Marcar alerta como resuelta"):
-            real_idx = df_hist_vis.index[idx_to_mark]
-            marcar_alerta_resuelta(real_idx)
-            st.success("✅ Alerta marcada como resuelta.")
+        # Opciones por clave: siguen apuntando a la misma alerta aunque el historial se relea distinto
+        por_marcar = st.multiselect(
+            "Alertas para marcar resueltas",
+            options=claves_alertas(df_hist_vis),
+            format_func=lambda clave: " · ".join(clave)
+        )
+        if st.button("Marcar alertas como resueltas") and por_marcar:
+            marcar_alertas_resueltas(por_marcar)
+            st.success(f"✅ {len(por_marcar)} alerta(s) marcada(s) como resuelta(s).")
             st.rerun()
     else:
-        st.info("No hay historial de alertas.")
\ No newline at end of file
+        st.info("No hay historial de alertas.")
+
+# TRM que no llegó a tiempo para el sidebar: se completa ahora y queda para el siguiente rerun
+if trm_pendiente:
+    trazas.fase("espera_trm")
+    trm_hoy, trm_manana = trm_o_ultima(futuro_trm)
+    mostrar_trm_sidebar(trm_hoy, trm_manana)
+    st.session_state["trm_sidebar"] = (trm_hoy, trm_manana)
+
+# -------------------------------
+# Panel de tiempos (administradores)
+# -------------------------------
+def _resumen_traza(registro):
+    kb = (registro['bytes_enviados'] + registro['bytes_recibidos']) / 1024
+    return f"{registro['ms']:,.0f} ms · {registro['llamadas']} llamada(s) remota(s) · {kb:,.1f} KB"
+
+if st.session_state.get("usuario") in TRAZAS_ADMINS:
+    trazas.fase("panel")
+    registro = st.session_state["traza"].registro()
+    with st.sidebar.expander("⏱️ Tiempos del rerun"):
+        st.caption(f"Este rerun (hasta el panel): {_resumen_traza(registro)}")
+        tramos = pd.DataFrame(registro['tramos'])
+        tramos['nombre'] = ["· " * n + nombre for n, nombre in zip(tramos['nivel'], tramos['nombre'])]
+        st.dataframe(tramos[['nombre', 'ms', 'llamadas', 'bytes_recibidos']], hide_index=True)
+        anterior = st.session_state.get("traza_anterior")
+        if anterior is not None:
+            st.caption(f"Rerun anterior ({anterior.estado}): {_resumen_traza(anterior.registro())}")
+        st.caption(f"Traza completa en {TRAZAS_ARCHIVO} (id {registro['id']})")
+
+trazas.terminar()
@@ -0,0 +1,16 @@
+import pytest
+
+from gestor import config, datos
+
+# Cada prueba trabaja en un directorio vacío, sin Google Sheets y con recursos del proceso nuevos
+
+@pytest.fixture(autouse=True)
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config.usar_secrets({})
+    recursos = (datos.get_almacen, datos.get_cache_lecturas, datos.get_journal)
+    for recurso in recursos:
+        recurso.limpiar()
+    yield tmp_path
+    for recurso in recursos:
+        recurso.limpiar()
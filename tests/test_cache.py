@@ -0,0 +1,25 @@
+import pandas as pd
+
+from gestor import datos
+from gestor.datos import CacheLecturas
+
+def test_vencidas_se_descartan_y_cada_tabla_tiene_un_maximo(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(datos._time, "monotonic", lambda: reloj[0])
+    cache = CacheLecturas(ttl=60)
+    lecturas = []
+    def leer(clave):
+        return cache.get("alertas", lambda: lecturas.append(clave) or pd.DataFrame({'x': [clave]}), clave=clave)
+
+    for clave in range(datos.CACHE_MAX_POR_TABLA + 5):
+        leer(clave)
+    assert len(cache._entradas) == datos.CACHE_MAX_POR_TABLA
+    leer(datos.CACHE_MAX_POR_TABLA + 4)
+    assert len(lecturas) == datos.CACHE_MAX_POR_TABLA + 5
+    leer(0)
+    assert lecturas[-1] == 0
+
+    # Una ventana que nadie vuelve a pedir no se queda en memoria después de vencer
+    reloj[0] += 61
+    cache.get("operaciones", lambda: pd.DataFrame())
+    assert list(cache._entradas) == [("operaciones", None)]
@@ -0,0 +1,56 @@
+import io
+
+from gestor import cli
+from gestor.datos import get_almacen
+from gestor.importacion import importar_operaciones
+
+ENCABEZADO = "Consecutivo,Modalidad,Tipo,Cliente,FechaLlegada\n"
+
+def importar(texto, actualizar=False):
+    return importar_operaciones(io.StringIO(ENCABEZADO + texto), "operaciones.csv", actualizar)
+
+def test_consecutivo_repetido_se_toma_de_la_ultima_fila():
+    resultado = importar("DO1,Marítimo,Importación,Cliente A,2026-11-01\n"
+                         "DO1,maritimo,IMPORTACION,Cliente B,01/12/2026\n")
+    assert resultado['insertados'] == ["DO1"]
+    assert resultado['errores'] == []
+    assert resultado['duplicados'] == [{'Fila': 2, 'Consecutivo': "DO1", 'FilaUsada': 3}]
+    operacion = get_almacen().leer_operaciones(consecutivos=["DO1"]).iloc[0]
+    assert operacion['Cliente'] == "Cliente B"
+    assert operacion['FechaLlegada'].strftime("%Y-%m-%d") == "2026-12-01"
+
+def test_reporte_de_errores_por_fila():
+    resultado = importar("DO1,Marítimo,Importación,Cliente A,2026-11-01\n"
+                         "DO2,Fluvial,Importación,Cliente A,2026-11-01\n"
+                         "DO3,Aéreo,Exportación,,2026-11-01\n"
+                         "DO4,Aéreo,Exportación,Cliente A,31/31/2026\n"
+                         ",Aéreo,Exportación,Cliente A,\n")
+    assert resultado['insertados'] == ["DO1"]
+    errores = {e['Fila']: e['Error'] for e in resultado['errores']}
+    assert sorted(errores) == [3, 4, 5, 6]
+    assert errores[3].startswith("Valor de Modalidad no reconocido")
+    assert errores[4] == "Cliente vacío"
+    assert "no es una fecha válida" in errores[5]
+    assert errores[6] == "Consecutivo vacío; FechaLlegada vacía"
+
+def test_existentes_se_omiten_salvo_al_actualizar():
+    importar("DO1,Marítimo,Importación,Cliente A,2026-11-01\n")
+    fila = "DO1,Marítimo,Importación,Cliente A,2026-11-05\nDO2,Aéreo,Exportación,Cliente B,2026-11-02\n"
+
+    resultado = importar(fila)
+    assert resultado['omitidos'] == ["DO1"]
+    assert resultado['insertados'] == ["DO2"]
+    llegada = get_almacen().leer_operaciones(consecutivos=["DO1"]).iloc[0]['FechaLlegada']
+    assert llegada.strftime("%Y-%m-%d") == "2026-11-01"
+
+    resultado = importar(fila, actualizar=True)
+    assert resultado['actualizados'] == ["DO1"]
+    assert resultado['sin_cambios'] == ["DO2"]
+
+def test_cli_no_falla_por_repetidos(directorio):
+    archivo = directorio / "operaciones.csv"
+    archivo.write_text(ENCABEZADO + "DO1,Aéreo,Importación,A,2026-11-01\nDO1,Aéreo,Importación,A,2026-11-02\n",
+                       encoding="utf-8")
+    assert cli.main(["importar", str(archivo)]) == 0
+    archivo.write_text(ENCABEZADO + "DO2,Aéreo,Importación,,2026-11-01\n", encoding="utf-8")
+    assert cli.main(["importar", str(archivo)]) == 1
@@ -0,0 +1,92 @@
+import pandas as pd
+
+from gestor import alertas, config, datos
+from gestor.datos import eliminar_operaciones, get_almacen, upsert_operaciones
+from gestor.storage import CALENDARIO_TIPOS, COLUMNAS_HISTORIAL, COLUMNAS_OPERACIONES
+
+def operacion(consecutivo, llegada, cliente="Cliente A"):
+    fila = dict.fromkeys(COLUMNAS_OPERACIONES, "")
+    fila.update(Consecutivo=consecutivo, Modalidad="Marítimo", Tipo="Importación", Cliente=cliente, FechaLlegada=llegada)
+    return fila
+
+def esperadas(operaciones):
+    # Las alertas fijas calculadas desde la FechaLlegada de cada operación, sin pasar por el calendario
+    return sorted(
+        (pd.Timestamp(op['FechaLlegada']) + pd.Timedelta(days=dias), alertas.TIPO_CALENDARIO[tipo], op['Consecutivo'])
+        for op in operaciones.values() for tipo, dias in CALENDARIO_TIPOS
+    )
+
+def generadas():
+    df = alertas.generar_alertas()
+    df = df[df['Tipo'] != alertas.TIPOS_ALERTA[3]]
+    return sorted(zip(df['Fecha'], df['Tipo'].astype(str), df['Consecutivo']))
+
+def test_calendario_sigue_a_las_operaciones(monkeypatch):
+    # Sin TRM no hay fecha de facturación: solo se comparan las alertas del calendario
+    monkeypatch.setattr(alertas, "serie_trm", lambda *args: pd.Series(dtype="float64"))
+    operaciones = {c: operacion(c, f"2026-11-{d:02d}") for c, d in [("DO1", 10), ("DO2", 1), ("DO3", 28)]}
+    upsert_operaciones(pd.DataFrame(operaciones.values()))
+    assert generadas() == esperadas(operaciones)
+
+    # Cambio de ETA, cambio sin ETA y borrado
+    operaciones["DO1"]['FechaLlegada'] = "2026-12-03"
+    operaciones["DO2"]['Cliente'] = "Cliente B"
+    upsert_operaciones(pd.DataFrame([operaciones["DO1"], operaciones["DO2"]]))
+    eliminar_operaciones(["DO3"])
+    del operaciones["DO3"]
+    assert generadas() == esperadas(operaciones)
+    assert set(get_almacen().leer_calendario()['Cliente']) == {"Cliente A", "Cliente B"}
+
+def test_calendario_se_recalcula_al_abrir_una_base_existente():
+    operaciones = {c: operacion(c, f"2026-10-{d:02d}") for c, d in [("DO1", 5), ("DO2", 20)]}
+    upsert_operaciones(pd.DataFrame(operaciones.values()))
+    with get_almacen()._connect() as conn:
+        conn.execute("DROP TABLE calendario")
+    get_almacen.limpiar()
+    calendario = get_almacen().leer_calendario()
+    assert sorted(zip(calendario['Fecha'], calendario['Tipo'], calendario['Consecutivo'])) == sorted(
+        (pd.Timestamp(op['FechaLlegada']) + pd.Timedelta(days=dias), tipo, op['Consecutivo'])
+        for op in operaciones.values() for tipo, dias in CALENDARIO_TIPOS
+    )
+
+class ReplicaEnMemoria:
+    # Réplica mínima para hidratar: solo lo que lee get_almacen
+    def __init__(self, operaciones):
+        self.operaciones = pd.DataFrame(operaciones, columns=COLUMNAS_OPERACIONES)
+        self.lecturas = 0
+
+    def leer_operaciones(self):
+        self.lecturas += 1
+        return self.operaciones
+
+    def leer_alertas(self):
+        return pd.DataFrame(columns=COLUMNAS_HISTORIAL)
+
+    def leer_archivo(self):
+        return pd.DataFrame(columns=COLUMNAS_OPERACIONES), pd.DataFrame(columns=COLUMNAS_HISTORIAL)
+
+def test_almacen_vacio_se_hidrata_desde_sheets_y_no_desde_los_csv(directorio, monkeypatch):
+    pd.DataFrame([operacion("CSV-1", "2025-01-10")]).to_csv(directorio / config.ARCHIVO_CSV, index=False)
+    replica = ReplicaEnMemoria([operacion("SHEETS-1", "2026-11-01")])
+    monkeypatch.setattr(datos, "sheets_configurado", lambda: True)
+    monkeypatch.setattr(datos, "get_replica_sheets", lambda: replica)
+    assert get_almacen().leer_operaciones()['Consecutivo'].tolist() == ["SHEETS-1"]
+    assert replica.lecturas == 1
+
+def test_sin_sheets_se_migran_los_csv(directorio):
+    pd.DataFrame([operacion("CSV-1", "2025-01-10")]).to_csv(directorio / config.ARCHIVO_CSV, index=False)
+    assert get_almacen().leer_operaciones()['Consecutivo'].tolist() == ["CSV-1"]
+
+def test_alertas_se_resuelven_por_clave_aunque_el_historial_cambie():
+    from datetime import date
+    datos.guardar_alertas_lote(datos.alertas_programadas("DO2", "Cliente B", date(2026, 11, 20)))
+    historial = datos.read_alertas_historial()
+    clave = next(c for c in datos.claves_alertas(historial) if "Liberación" in c[1])
+
+    # Otra sesión guarda antes de que esta marque: las posiciones del historial se corren
+    datos.guardar_alertas_lote(datos.alertas_programadas("DO1", "Cliente A", date(2026, 11, 10)))
+    datos.marcar_alertas_resueltas([clave])
+
+    resueltas = datos.read_alertas_historial().query("Resuelta == True")
+    assert datos.claves_alertas(resueltas) == [clave]
+    assert clave == ("DO2", "Programada: Solicitar Liberación", "2026-11-18")
@@ -0,0 +1,31 @@
+import threading
+
+from gestor import trazas
+
+def test_trabajo_en_otro_hilo_se_suma_a_la_traza_del_rerun():
+    rerun = trazas.iniciar("rerun")
+    trazas.fase("arranque")
+
+    def tarea():
+        with trazas.en_hilo(rerun, "precarga"):
+            with trazas.tramo("leer:operaciones"):
+                trazas.actual().contar(10, 200)
+
+    hilo = threading.Thread(target=tarea)
+    hilo.start()
+    hilo.join()
+    registro = trazas.terminar().registro()
+
+    assert (registro['llamadas'], registro['bytes_enviados'], registro['bytes_recibidos']) == (1, 10, 200)
+    assert [(t['nombre'], t['nivel']) for t in registro['tramos']] == [
+        ("arranque", 0), ("precarga", 1), ("leer:operaciones", 2)]
+    assert registro['tramos'][2]['llamadas'] == 1
+
+def test_hilo_que_termina_despues_del_rerun_se_escribe_aparte(monkeypatch):
+    escritas = []
+    monkeypatch.setattr(trazas, "_escribir", escritas.append)
+    rerun = trazas.iniciar("rerun")
+    trazas.terminar()
+    with trazas.en_hilo(rerun, "tardia"):
+        pass
+    assert [t.etiqueta for t in escritas] == ["rerun", "tardia"]